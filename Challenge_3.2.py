@@ -1,7 +1,9 @@
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import pyarrow.parquet as pq
+
+import multiday
+import rendering
 
 # List of filenames to read
 file_names = [
@@ -12,76 +14,78 @@ file_names = [
     '20220120.parquet'   # Jan 20, 2022
 ]
 
-# Initialize an empty list to store numpy arrays for each dataset
-summit_input_powers = []
-power_magnitudes = []
-power_gradients = []
-power_spectrum_magnitudes = []
-power_psd = []
-positive_frequencies_scaled = []
-
-# Processing steps for each file
-for file_name in file_names:
-    df = pq.read_table(file_name).to_pandas().drop_duplicates()     # Create dataframe and drop duplicates
-    df = df.groupby(['timestamp', 'hostname']).agg({                # Average power values with same hostname and timestamp
-        'ps0_input_power': 'mean', 'ps1_input_power': 'mean'
-    }).reset_index()
-    
-    # Calculate input power and create a new column for cabinet names
-    df['input_power'] = df['ps0_input_power'] + df['ps1_input_power']
-    df['cabinet'] = df['hostname'].str[:3]
-
-    # Group by timestamp and cabinet, then aggregate input_power for the entire system
-    df_summit = df.groupby(['timestamp']).agg({'input_power': 'sum'}).reset_index()
-    summit_input_powers.append(df_summit['input_power'].values)
-    
-    # Calculate the power fluctuations
-    power_fluctuations = df_summit['input_power'].diff()
-    power_fluctuations = power_fluctuations[1:]  # Remove the first row with NaN due to diff() method
-    
-    # Calculate the power magnitudes
-    power_magnitude = np.abs(power_fluctuations)
-    power_magnitudes.append(power_magnitude)
-    
-    # Calculate the power gradients using np.gradient
-    power_gradient = np.gradient(df_summit['input_power'].values)
-    power_gradients.append(power_gradient)
-    
-    # Apply FFT to power fluctuations to compute the Power Spectrum
-    spectrum = np.fft.fft(power_fluctuations)
-    spectrum_real = np.real(spectrum)                   # Take real part of spectrum data
-    power_spectrum = np.abs(spectrum_real) ** 2         # Take absolute values and squares them to obtain power spectrum
-    power_spectrum_magnitudes.append(power_spectrum)
-    
-    # Compute the Power Spectral Density (PSD)
-    sampling_rate = 1 / 60  # 1 minute = 1/60 hour
-    positive_spectrum = spectrum_real[1:len(spectrum) // 2] # Exclude the first element (DC component) and the negative frequencies
-    psd = positive_spectrum / (len(power_fluctuations) * sampling_rate)
-    power_psd.append(psd)
+# Number of worker processes used to process the days in parallel (None uses every core)
+workers = None
+
+# Optional directory keeping a second copy of the cleaned per-node-minute tables. Later runs read the
+# query index below, which persists on its own, so None keeps only the index
+cache_dir = None
+
+# Directory of the per-day cabinet rollups the system power is read from
+rollup_dir = '.summit_rollups'
+
+# Directory of the per-day query indexes the rollups are built from
+index_dir = '.summit_index'
+
+# Keep the HTML files proportional to screen resolution: every line is downsampled to at most
+# rendering.MAX_LINE_POINTS points with LTTB, drawn with WebGL, and plotly.js is loaded from one shared file.
+# Set to False to write every point with plotly.js inlined.
+reduced_html = True
+trace_type = go.Scattergl if reduced_html else go.Scatter
+max_line_points = rendering.MAX_LINE_POINTS if reduced_html else None
+plotlyjs = rendering.PLOTLYJS if reduced_html else True
+
+# Each day is read, deduplicated, averaged and analysed in its own process. The workers return numpy arrays
+# for the system input power, power magnitudes, power gradients, power spectrum and power spectral density (PSD),
+# along with the frequencies (cycles per day) of the spectrum and PSD, and the cabinets of the day ranked by
+# their largest minute-to-minute power swings, computed for every cabinet at once.
+# Every column of a file is read once, when its day is indexed: duplicate rows are detected over whole rows as
+# drop_duplicates() did, and the two power columns alone cannot tell a repeated row from a different reading
+# at the same minute. summit_io.read_node_minutes(file_name, columns, dedup_columns=[...]) reads only the
+# timestamp, hostname and listed columns when comparing those is enough.
+days = multiday.process_days(multiday.power_day, file_names, workers, cache_dir=cache_dir, store_dir=rollup_dir,
+                             index_dir=index_dir)
+summit_input_powers = [day['input_power'] for day in days]
+power_magnitudes = [day['magnitude'] for day in days]
+power_gradients = [day['gradient'] for day in days]
+power_spectrum_magnitudes = [day['spectrum'] for day in days]
+power_psd = [day['psd'] for day in days]
+spectrum_frequencies = [day['spectrum_frequencies'] for day in days]
+psd_frequencies = [day['psd_frequencies'] for day in days]
+
+# Dates and subplot layout follow the number of files
+dates = [multiday.day_label(file_name) for file_name in file_names]
+num_plots = len(file_names)
+
+# Cabinets of each day with the largest minute-to-minute power swings
+for date, day in zip(dates, days):
+    print(f'{date}: cabinets with the largest power swings')
+    print(day['swings'].to_pandas().to_string(index=False))
 
 # Create Figure objects for each chart
-fig_power_consumption = make_subplots(rows=1, cols=5, shared_yaxes=True, 
-                                     subplot_titles=['Jan 20, 2020', 'Aug 20, 2020', 'Feb 20, 2021', 'Aug 10, 2021', 'Jan 20, 2022'],
+fig_power_consumption = make_subplots(rows=1, cols=num_plots, shared_yaxes=True, 
+                                     subplot_titles=dates,
                                      horizontal_spacing=0.002)
 
-fig_power_magnitude = make_subplots(rows=1, cols=5, shared_yaxes=True, 
-                                    subplot_titles=['Jan 20, 2020', 'Aug 20, 2020', 'Feb 20, 2021', 'Aug 10, 2021', 'Jan 20, 2022'],
+fig_power_magnitude = make_subplots(rows=1, cols=num_plots, shared_yaxes=True, 
+                                    subplot_titles=dates,
                                     horizontal_spacing=0.002)
 
-fig_power_gradient = make_subplots(rows=1, cols=5, shared_yaxes=True, 
-                                   subplot_titles=['Jan 20, 2020', 'Aug 20, 2020', 'Feb 20, 2021', 'Aug 10, 2021', 'Jan 20, 2022'],
+fig_power_gradient = make_subplots(rows=1, cols=num_plots, shared_yaxes=True, 
+                                   subplot_titles=dates,
                                    horizontal_spacing=0.002)
 
-fig_power_spectrum = make_subplots(rows=1, cols=5, shared_yaxes=True, 
-                                   subplot_titles=['Jan 20, 2020', 'Aug 20, 2020', 'Feb 20, 2021', 'Aug 10, 2021', 'Jan 20, 2022'],
+fig_power_spectrum = make_subplots(rows=1, cols=num_plots, shared_yaxes=True, 
+                                   subplot_titles=dates,
                                    horizontal_spacing=0.002)
 
-fig_power_psd = make_subplots(rows=1, cols=5, shared_yaxes=True, 
-                              subplot_titles=['Jan 20, 2020', 'Aug 20, 2020', 'Feb 20, 2021', 'Aug 10, 2021', 'Jan 20, 2022'],
+fig_power_psd = make_subplots(rows=1, cols=num_plots, shared_yaxes=True, 
+                              subplot_titles=dates,
                               horizontal_spacing=0.002)
 
-# Create a list of colors for each day
+# Create a list of colors for each day, repeated when there are more than five days
 colors = ['green', 'blue', 'purple', 'orange', 'red']
+colors = [colors[i % len(colors)] for i in range(num_plots)]
 
 # Define tick values and labels for Power Consumption, Power Magnitude, and Power Gradient Charts
 tick_values_power_consumption = [360, 720, 1080]
@@ -94,38 +98,42 @@ tick_labels_other_charts = ['180', '360', '540']
 # Add traces to each subplot with coordinated colors and numpy arrays for Power Consumption, Power Gradient, and Power Spectrum charts
 for i, (y_power_consumption, y_power_magnitude, y_power_gradient, y_power_spectrum, y_power_psd) in enumerate(zip(summit_input_powers, power_magnitudes, power_gradients, power_spectrum_magnitudes, power_psd)):
     x_power_consumption = np.arange(len(y_power_consumption))
-    x_other_charts = np.fft.fftfreq(len(y_power_magnitude), d=(1 / 60))[1:len(y_power_magnitude) // 2] * 24
+    x_power_consumption, y_power_consumption = rendering.lttb(x_power_consumption, y_power_consumption, max_line_points)
+    x_power_magnitude, y_power_magnitude = rendering.lttb(np.arange(len(y_power_magnitude)), y_power_magnitude, max_line_points)
+    x_power_gradient, y_power_gradient = rendering.lttb(np.arange(len(y_power_gradient)), y_power_gradient, max_line_points)
+    x_power_spectrum, y_power_spectrum = rendering.lttb(spectrum_frequencies[i], y_power_spectrum, max_line_points)
+    x_power_psd, y_power_psd = rendering.lttb(psd_frequencies[i], y_power_psd, max_line_points)
     
     # Add traces to each subplot of Power Consumption chart
-    fig_power_consumption.add_trace(go.Scatter(x=x_power_consumption, y=y_power_consumption, name=f'Plot {i+1}', line=dict(color=colors[i])),
+    fig_power_consumption.add_trace(trace_type(x=x_power_consumption, y=y_power_consumption, name=f'Plot {i+1}', line=dict(color=colors[i])),
                                     row=1, col=i+1)
     fig_power_consumption.update_xaxes(tickmode='array', tickvals=tick_values_power_consumption, ticktext=tick_labels_power_consumption, row=1, col=i+1,
                                        tickfont=dict(size=15))
     fig_power_consumption.update_yaxes(tickfont=dict(size=15), row=1, col=i+1)
 
     # Add traces to each subplot of Power Magnitude chart
-    fig_power_magnitude.add_trace(go.Scatter(x=x_power_consumption, y=y_power_magnitude, name=f'Plot {i+1}', line=dict(color=colors[i])),
+    fig_power_magnitude.add_trace(trace_type(x=x_power_magnitude, y=y_power_magnitude, name=f'Plot {i+1}', line=dict(color=colors[i])),
                                   row=1, col=i+1)
     fig_power_magnitude.update_xaxes(tickmode='array', tickvals=tick_values_power_consumption, ticktext=tick_labels_power_consumption, row=1, col=i+1,
                                      tickfont=dict(size=15))
     fig_power_magnitude.update_yaxes(tickfont=dict(size=15), row=1, col=i+1)
     
     # Add traces to each subplot of Power Gradient chart
-    fig_power_gradient.add_trace(go.Scatter(x=x_power_consumption, y=y_power_gradient, name=f'Plot {i+1}', line=dict(color=colors[i])),
+    fig_power_gradient.add_trace(trace_type(x=x_power_gradient, y=y_power_gradient, name=f'Plot {i+1}', line=dict(color=colors[i])),
                                  row=1, col=i+1)
     fig_power_gradient.update_xaxes(tickmode='array', tickvals=tick_values_power_consumption, ticktext=tick_labels_power_consumption, row=1, col=i+1,
                                     tickfont=dict(size=15))
     fig_power_gradient.update_yaxes(tickfont=dict(size=15), row=1, col=i+1)
     
     # Add traces to each subplot of Power Spectrum chart
-    fig_power_spectrum.add_trace(go.Scatter(x=x_other_charts, y=y_power_spectrum, name=f'Plot {i+1}', line=dict(color=colors[i])),
+    fig_power_spectrum.add_trace(trace_type(x=x_power_spectrum, y=y_power_spectrum, name=f'Plot {i+1}', line=dict(color=colors[i])),
                                  row=1, col=i+1)
     fig_power_spectrum.update_xaxes(tickmode='array', tickvals=tick_values_other_charts, ticktext=tick_labels_other_charts, row=1, col=i+1,
                                     tickfont=dict(size=15))
     fig_power_spectrum.update_yaxes(tickfont=dict(size=15), row=1, col=i+1)
 
     # Add traces to each subplot of Power Spectral Density chart
-    fig_power_psd.add_trace(go.Scatter(x=x_other_charts, y=y_power_psd, name=f'Plot {i+1}', line=dict(color=colors[i])),
+    fig_power_psd.add_trace(trace_type(x=x_power_psd, y=y_power_psd, name=f'Plot {i+1}', line=dict(color=colors[i])),
                             row=1, col=i+1)
     fig_power_psd.update_xaxes(tickmode='array', tickvals=tick_values_other_charts, ticktext=tick_labels_other_charts, row=1, col=i+1,
                                tickfont=dict(size=15))
@@ -134,40 +142,39 @@ for i, (y_power_consumption, y_power_magnitude, y_power_gradient, y_power_spectr
 
 
 # Update layout of the Power Consumption chart
-fig_power_consumption.update_layout(height=400, width=1200, title='SUMMIT Power Consumption Comparison',
+fig_power_consumption.update_layout(height=400, width=240 * num_plots, title='SUMMIT Power Consumption Comparison',
                                     showlegend=False, margin=dict(l=10, r=10, t=50, b=50),
                                     xaxis=dict(title='<b>Hour of Day<b>', titlefont=dict(size=15)), 
                                     yaxis=dict(title='<b>Power Draw (Watts)<b>', titlefont=dict(size=15)))
 
 # Update layout of the Power Magnitude chart
-fig_power_magnitude.update_layout(height=400, width=1200, title='SUMMIT Power Magnitude Comparison',
+fig_power_magnitude.update_layout(height=400, width=240 * num_plots, title='SUMMIT Power Magnitude Comparison',
                                   showlegend=False, margin=dict(l=10, r=10, t=50, b=50),
                                   xaxis=dict(title='<b>Hour of Day<b>', titlefont=dict(size=15)), 
                                   yaxis=dict(title='<b>Power Magnitude (Watts)<b>', titlefont=dict(size=15)))
 
 # Update layout of the Power Gradient chart
-fig_power_gradient.update_layout(height=400, width=1200, title='SUMMIT Power Gradient Comparison',
+fig_power_gradient.update_layout(height=400, width=240 * num_plots, title='SUMMIT Power Gradient Comparison',
                                  showlegend=False, margin=dict(l=10, r=10, t=50, b=50),
                                  xaxis=dict(title='<b>Hour of Day<b>', titlefont=dict(size=15)), 
                                  yaxis=dict(title='<b>Power Dynamics (W/min)<b>', titlefont=dict(size=15)))
 
 # Update layout of the Power Spectrum chart
-fig_power_spectrum.update_layout(height=400, width=1200, title='SUMMIT Power Spectrum Comparison',
+fig_power_spectrum.update_layout(height=400, width=240 * num_plots, title='SUMMIT Power Spectrum Comparison',
                                  showlegend=False, margin=dict(l=10, r=10, t=50, b=50),
                                  xaxis=dict(title='<b>Frequency (720 Cycles per Day)<b>', titlefont=dict(size=15)), 
                                  yaxis=dict(title='<b>Power Spectrum Magnitude (Watts)<b>', titlefont=dict(size=15)))
 
 # Update layout of the Power Spectral Density chart
-fig_power_psd.update_layout(height=400, width=1200, title='SUMMIT Power Spectral Density Comparison',
+fig_power_psd.update_layout(height=400, width=240 * num_plots, title='SUMMIT Power Spectral Density Comparison',
                             showlegend=False, margin=dict(l=10, r=10, t=50, b=50),
                             xaxis=dict(title='<b>Frequency (720 Cycles per Day)<b>', titlefont=dict(size=15)), 
                             yaxis=dict(title='<b>PSD (Watts\u00B2 / Cycles Per Day)<b>', titlefont=dict(size=15)))
 
 # Create shapes to set background color for each subplot
 shapes = []
-num_plots = 5
 num_rows = 1
-num_cols = 5
+num_cols = num_plots
 for row in range(1, num_rows + 1):
     for col in range(1, num_cols + 1):
         shape = dict(
@@ -193,11 +200,11 @@ fig_power_spectrum.update_layout(shapes=shapes)
 fig_power_psd.update_layout(shapes=shapes)
 
 # Write the charts to HTML files
-fig_power_consumption.write_html("SUMMIT_Power_Consumption.html")
-fig_power_magnitude.write_html("SUMMIT_Power_Magnitude.html")
-fig_power_gradient.write_html("SUMMIT_Power_Gradient.html")
-fig_power_spectrum.write_html("SUMMIT_Power_Spectrum.html")
-fig_power_psd.write_html("SUMMIT_Power_Spectral_Density.html")
+rendering.write_html(fig_power_consumption, "SUMMIT_Power_Consumption.html", plotlyjs)
+rendering.write_html(fig_power_magnitude, "SUMMIT_Power_Magnitude.html", plotlyjs)
+rendering.write_html(fig_power_gradient, "SUMMIT_Power_Gradient.html", plotlyjs)
+rendering.write_html(fig_power_spectrum, "SUMMIT_Power_Spectrum.html", plotlyjs)
+rendering.write_html(fig_power_psd, "SUMMIT_Power_Spectral_Density.html", plotlyjs)
 
 
 
@@ -0,0 +1,277 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Vectorized aggregation engine for the SUMMIT node telemetry.
+# Sensor columns are found by name pattern instead of being listed by hand, and per-(timestamp, hostname)
+# means are computed by sorting integer keys once and summing the contiguous blocks of equal keys.
+
+# Column families of the SUMMIT schema, matched against the column names
+COLUMN_FAMILIES = {
+    'gpu_power': r'p\d+_gpu\d+_power',
+    'cpu_power': r'p\d+_power',
+    'gpu_core_temp': r'gpu\d+_core_temp',
+    'gpu_mem_temp': r'gpu\d+_mem_temp',
+    'cpu_core_temp': r'p\d+_core\d+_temp',
+    'input_power': r'ps\d+_input_power',
+}
+
+# Families averaged into node_temp_mean and summed into input_power
+TEMPERATURE_FAMILIES = ['gpu_core_temp', 'gpu_mem_temp', 'cpu_core_temp']
+INPUT_POWER_FAMILIES = ['input_power']
+
+# Storage type of the cleaned sensor means. float32 keeps about seven significant digits, more than the sensors
+# report, in half the memory. Sums are always accumulated in float64.
+SENSOR_DTYPE = np.float32
+
+
+# Groups column names by family, keeping the order in which they appear in `names`
+def find_columns(names, families=None):
+    families = COLUMN_FAMILIES if families is None else families
+    return {family: [name for name in names if re.fullmatch(pattern, name)]
+            for family, pattern in families.items()}
+
+
+# Flattens the columns of the selected families into one list
+def family_columns(columns_by_family, families=None):
+    families = list(columns_by_family) if families is None else families
+    return [name for family in families for name in columns_by_family[family]]
+
+
+# Runs longer than this are summed with np.add.reduceat, shorter ones by adding rows offset by offset
+SHORT_SEGMENT_LENGTH = 16
+
+
+# Sums rows of `values` over the contiguous segments beginning at `starts`.
+# np.add.reduceat pays a fixed cost per segment, which dominates when most keys hold one or two rows,
+# so short segments are summed by adding the k-th row of every segment longer than k instead.
+def segment_sums(values, starts):
+    lengths = np.diff(np.r_[starts, len(values)])
+    if lengths.max() > SHORT_SEGMENT_LENGTH:
+        return np.add.reduceat(values, starts, axis=0)
+    sums = values[starts]
+    for offset in range(1, lengths.max()):
+        segments = np.flatnonzero(lengths > offset)
+        sums[segments] += values[starts[segments] + offset]
+    return sums
+
+
+# Means from sums and counts, NaN where a key has no values like groupby().mean()
+def means_from_sums(sums, counts):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts        # sums are 0 wherever counts are 0, and 0 / 0 gives NaN
+
+
+# input_power (sum of the supply inputs) and node_temp_mean (average of every temperature sensor) of every row.
+# `column` returns the float64 values of a column by name. Columns are added one at a time, so no
+# [row x column] block is ever built.
+def node_metric_values(column, columns_by_family, num_rows):
+    temp_sum = np.zeros(num_rows)
+    temp_count = np.zeros(num_rows, dtype=np.int32)
+    for name in family_columns(columns_by_family, TEMPERATURE_FAMILIES):
+        values = column(name)
+        valid = ~np.isnan(values)
+        np.add(temp_sum, values, out=temp_sum, where=valid)
+        temp_count += valid
+    # A missing supply reading leaves input_power missing, as ps0_input_power + ps1_input_power did
+    input_power = np.zeros(num_rows)
+    for name in family_columns(columns_by_family, INPUT_POWER_FAMILIES):
+        input_power += column(name)
+    return input_power, means_from_sums(temp_sum, temp_count)
+
+
+# Adds input_power and node_temp_mean to a per-node frame
+def add_node_metrics(df, columns_by_family):
+    df['input_power'], df['node_temp_mean'] = node_metric_values(
+        lambda name: df[name].to_numpy(dtype=np.float64), columns_by_family, len(df))
+    return df
+
+
+# input_power and node_temp_mean of every row of an Arrow table or record batch
+def table_node_metrics(data, columns_by_family):
+    return node_metric_values(
+        lambda name: np.asarray(column_array(data, name).to_numpy(zero_copy_only=False), dtype=np.float64),
+        columns_by_family, data.num_rows)
+
+
+# Categorical cabinets (hostname[:3]) of categorical hostnames, sliced from the distinct hostnames only
+def cabinet_categories(hostnames):
+    hostnames = pd.Categorical(hostnames)
+    cabinets, cabinet_of_host = np.unique(hostnames.categories.astype(str).str[:3].to_numpy(dtype=object),
+                                          return_inverse=True)
+    codes = np.where(hostnames.codes >= 0, cabinet_of_host[np.maximum(hostnames.codes, 0)], -1)
+    return pd.Categorical.from_codes(codes, categories=cabinets)
+
+
+# Fused dedup + averaging over Arrow data.
+# Rows are keyed by integer codes built from int64 timestamps and dictionary-encoded hostnames. Exact
+# duplicates can only occur among rows sharing a key, so the wide float columns are never used as keys:
+# they are folded into a 64-bit fingerprint that orders the rows inside each key, and adjacent rows with the
+# same key and fingerprint are confirmed as duplicates by comparing every column word for word.
+
+FINGERPRINT_SEED = np.uint64(0xCBF29CE484222325)
+FINGERPRINT_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+NULL_WORD = np.uint64(0x7FF8DEADBEEF0001)
+
+
+# Timestamps of an Arrow column as int64
+def timestamp_values(array):
+    return pc.cast(array, pa.int64()).to_numpy(zero_copy_only=False)
+
+
+# Length of one minute in a timestamp unit such as 'ns'
+def minute_length(unit):
+    return pd.Timedelta(minutes=1) // pd.Timedelta(1, unit=unit)
+
+
+# Reinterprets an Arrow column as uint64 words that are equal exactly when drop_duplicates() treats the
+# values as equal: -0.0 and 0.0 match, every NaN matches, and strings are compared by their value hash
+def column_words(array):
+    if pa.types.is_floating(array.type):
+        words = np.asarray(array.to_numpy(zero_copy_only=False), dtype=np.float64) + 0.0    # nulls become NaN
+        words[np.isnan(words)] = np.nan
+        return words.view(np.uint64)
+    if pa.types.is_integer(array.type) or pa.types.is_temporal(array.type) or pa.types.is_boolean(array.type):
+        words = pc.cast(array, pa.int64()).fill_null(0).to_numpy().view(np.uint64)
+    else:
+        if not pa.types.is_dictionary(array.type):
+            array = array.dictionary_encode()
+        dictionary_words = pd.util.hash_array(array.dictionary.to_numpy(zero_copy_only=False).astype(object))
+        words = dictionary_words[array.indices.fill_null(0).to_numpy()]
+    if array.null_count:
+        words = np.where(array.is_null().to_numpy(zero_copy_only=False), NULL_WORD, words)
+    return words
+
+
+# Folds the words of every column into one 64-bit fingerprint per row, one column at a time
+def fingerprint(arrays, num_rows):
+    fingerprints = np.full(num_rows, FINGERPRINT_SEED, dtype=np.uint64)
+    for array in arrays:
+        fingerprints ^= column_words(array)
+        fingerprints *= FINGERPRINT_MULTIPLIER
+        fingerprints ^= fingerprints >> np.uint64(29)
+    return fingerprints
+
+
+# Drops exact duplicate rows. `keys` are int64 (timestamp, hostname) codes and `arrays` the Arrow columns
+# that define a duplicate. Returns the kept row positions sorted by key, and their fingerprints.
+def drop_duplicate_rows(keys, arrays):
+    fingerprints = fingerprint(arrays, len(keys))
+    order = np.lexsort((fingerprints, keys))
+    sorted_keys, sorted_fingerprints = keys[order], fingerprints[order]
+    candidates = np.flatnonzero((sorted_keys[1:] == sorted_keys[:-1]) &
+                                (sorted_fingerprints[1:] == sorted_fingerprints[:-1])) + 1
+
+    # Confirm each candidate against the row before it, reading only the candidate rows
+    duplicate = np.ones(len(candidates), dtype=bool)
+    current, previous = pa.array(order[candidates]), pa.array(order[candidates - 1])
+    for array in arrays:
+        duplicate &= column_words(array.take(current)) == column_words(array.take(previous))
+    keep = np.ones(len(order), dtype=bool)
+    keep[candidates[duplicate]] = False
+    return order[keep], sorted_fingerprints[keep]
+
+
+# Sums and non-null counts per key for rows already sorted by key.
+# `columns` yields one float array per value column, so only one column is expanded at a time.
+# Counts are int32, which holds the rows of any one key.
+def sorted_group_sums(sorted_keys, columns, num_columns):
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(sorted_keys) else sorted_keys
+    lengths = np.diff(np.r_[starts, len(sorted_keys)])
+    sums = np.empty((len(starts), num_columns), dtype=np.float64, order='F')
+    counts = np.empty((len(starts), num_columns), dtype=np.int32, order='F')
+    for i, values in enumerate(columns):
+        if not len(starts):
+            continue
+        missing = np.isnan(values)
+        if missing.any():
+            sums[:, i] = segment_sums(np.where(missing, 0.0, values), starts)
+            counts[:, i] = segment_sums((~missing).astype(np.int32), starts)
+        else:
+            sums[:, i] = segment_sums(values, starts)
+            counts[:, i] = lengths
+    return sorted_keys[starts], sums, counts
+
+
+# One Arrow column of a table or record batch as a single array
+def column_array(data, name):
+    array = data.column(name)
+    return array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+
+
+# Hostname codes ranked in lexical order, with the sorted unique hostnames they index.
+# Only the dictionary of distinct hostnames is sorted, never the per-row strings.
+def hostname_codes(array):
+    if not pa.types.is_dictionary(array.type):
+        array = array.dictionary_encode()
+    dictionary = array.dictionary.to_numpy(zero_copy_only=False).astype(object)
+    order = np.argsort(dictionary, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[array.indices.to_numpy(zero_copy_only=False)], dictionary[order]
+
+
+# Float64 values of each of `columns` at the given rows of an Arrow table or record batch, one column at a time
+def float_columns(data, columns, rows):
+    for name in columns:
+        yield np.asarray(column_array(data, name).to_numpy(zero_copy_only=False), dtype=np.float64)[rows]
+
+
+# Fused drop_duplicates() + groupby(['timestamp', 'hostname']).mean() over an in-memory Arrow table.
+# Duplicates are detected over `dedup_columns` (every column by default); the result matches the two-step
+# pandas version, sorted by timestamp then hostname, with means of `dtype`.
+def dedup_means(table, columns, dedup_columns=None, dtype=np.float64):
+    return grouped_means(*dedup_keys(table, dedup_columns), columns, dtype)
+
+
+# The drop_duplicates() step of dedup_means(). Returns the table without rows missing a key, the positions of
+# its first occurrence of every distinct row with their integer (timestamp, hostname) keys, and the sorted
+# int64 timestamps and hostnames the keys are built from.
+def dedup_keys(table, dedup_columns=None):
+    if table['timestamp'].null_count or table['hostname'].null_count:        # groupby() drops rows without a key
+        table = table.filter(pc.and_(pc.is_valid(table['timestamp']), pc.is_valid(table['hostname'])))
+    dedup_columns = table.schema.names if dedup_columns is None else dedup_columns
+
+    # Integer keys: timestamp codes times the hostname count plus the rank of the hostname
+    timestamp_uniques, timestamp_codes = np.unique(timestamp_values(column_array(table, 'timestamp')),
+                                                   return_inverse=True)
+    host_codes, hostnames = hostname_codes(column_array(table, 'hostname'))
+    keys = timestamp_codes.astype(np.int64) * len(hostnames) + host_codes
+
+    rows, _ = drop_duplicate_rows(keys, [column_array(table, name) for name in dedup_columns])
+    return table, rows, keys[rows], timestamp_uniques, hostnames
+
+
+# The groupby().mean() step of dedup_means(), over the rows and keys returned by dedup_keys()
+def grouped_means(table, rows, keys, timestamp_uniques, hostnames, columns, dtype=np.float64):
+    unique_keys, sums, counts = sorted_group_sums(keys, float_columns(table, columns, rows), len(columns))
+    timestamp_codes, host_codes = np.divmod(unique_keys, len(hostnames))
+    return keyed_means(timestamp_uniques[timestamp_codes], table.schema.field('timestamp').type,
+                       host_codes, hostnames, columns, sums, counts, dtype)
+
+
+# Means of `dtype` from float64 sums and counts. float64 means reuse the sums array; narrower ones are
+# written to a new array of their own size.
+def means_array(sums, counts, dtype=np.float64):
+    out = sums if np.dtype(dtype) == sums.dtype else np.empty_like(sums, dtype=dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.divide(sums, counts, out=out, casting='same_kind')
+
+
+# Builds the per-(timestamp, hostname) frame of the means of `columns` from int64 timestamps, the hostname
+# codes of every key with the hostnames they index, and float sums and counts
+def keyed_means(timestamps, timestamp_type, host_codes, hostnames, columns, sums, counts, dtype=np.float64):
+    return keyed_frame(timestamps, timestamp_type, host_codes, hostnames, columns,
+                       means_array(sums, counts, dtype))
+
+
+# Per-(timestamp, hostname) frame with a categorical hostname and `values` handed to pandas without a copy
+def keyed_frame(timestamps, timestamp_type, host_codes, hostnames, columns, values):
+    keys = pd.DataFrame({
+        'timestamp': pa.array(timestamps, pa.int64()).cast(timestamp_type).to_pandas(),
+        'hostname': pd.Categorical.from_codes(host_codes, categories=hostnames),
+    })
+    return pd.concat([keys, pd.DataFrame(values, columns=columns, copy=False)], axis=1)
@@ -0,0 +1,54 @@
+import argparse
+import time
+
+import pandas as pd
+
+import aggregation
+import synthetic
+
+# Benchmark of the fused dedup + (timestamp, hostname) averaging stage against the two-step
+# drop_duplicates() + groupby().agg() used by the original scripts, on a synthetic day of telemetry
+# (see synthetic.py).
+# Run from the repository root:
+#     python -m benchmarks.bench_dedup                          # full day: 4626 nodes x 1440 minutes
+#     python -m benchmarks.bench_dedup --nodes 500 --minutes 240
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fused dedup benchmark')
+    parser.add_argument('--nodes', type=int, default=synthetic.NODES)
+    parser.add_argument('--minutes', type=int, default=synthetic.MINUTES)
+    parser.add_argument('--duplicates', type=float, default=synthetic.DUPLICATE_FRACTION, help='extra rows as a fraction of the day')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    table, columns = synthetic.synthetic_day(args.nodes, args.minutes, args.duplicates)
+    print(f'{table.num_rows:,} rows x {table.num_columns} columns ({table.nbytes / 2**20:,.0f} MiB)')
+
+    def two_step():
+        df = table.to_pandas().drop_duplicates()
+        return df.groupby(['timestamp', 'hostname']).agg({name: 'mean' for name in columns}).reset_index()
+
+    def fused():
+        return aggregation.dedup_means(table, columns)
+
+    timings = {}
+    for name, stage in (('two-step', two_step), ('fused', fused)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = stage()
+            best = min(best, time.perf_counter() - started)
+        timings[name] = (best, result)
+        print(f'{name:>8}: {best:8.2f} s')
+
+    # The fused result has a categorical hostname; compare the values as strings. The whole day is one table, so
+    # every duplicate is confirmed column by column and only the summation order differs.
+    expected, actual = timings['two-step'][1], timings['fused'][1]
+    actual = actual.astype({'hostname': expected['hostname'].dtype})
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_exact=False, rtol=1e-12)
+    print(f' speedup: {timings["two-step"][0] / timings["fused"][0]:8.2f}x (results match)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import csv
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import aggregation
+import rendering
+import rollup
+import spectral
+import summit_io
+import synthetic
+
+# Stage-by-stage benchmark of the processing pipeline on synthetic SUMMIT telemetry.
+# For every data scale a synthetic Parquet file is written, then each engine runs the stages of the scripts in
+# order (read, dedup, groupby, node_temp_mean, cabinet rollup, FFT/PSD and HTML export), recording the wall
+# time and the peak resident memory each stage adds. The 'pandas' engine is the original scripts' code and
+# 'arrow' the shared modules used now. Scales multiply the number of minutes of the base file.
+# Run from the repository root:
+#     python -m benchmarks.bench_pipeline                                   # 250 nodes x 60 minutes at 1x, 10x, 100x
+#     python -m benchmarks.bench_pipeline --scales 1 10 --engines arrow --csv results.csv
+
+STAGES = ['read', 'dedup', 'groupby', 'node_temp_mean', 'cabinet_rollup', 'fft_psd', 'html_export']
+SAMPLE_INTERVAL = 0.005     # seconds between resident memory samples
+
+
+# Resident set size of this process in bytes
+def resident_bytes():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+# Samples the resident memory in a background thread while a stage runs. `peak` is the largest increase
+# over the resident memory at the start of the stage, which includes Arrow buffers that tracemalloc misses.
+class PeakMemory:
+    def __enter__(self):
+        self.start = self.peak_bytes = resident_bytes()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def _sample(self):
+        while not self.done.wait(SAMPLE_INTERVAL):
+            self.peak_bytes = max(self.peak_bytes, resident_bytes())
+
+    def __exit__(self, *exc_info):
+        self.done.set()
+        self.thread.join()
+        self.peak_bytes = max(self.peak_bytes, resident_bytes())
+        self.peak = self.peak_bytes - self.start
+
+
+# Bytes of the HTML files (and shared plotly.js bundle) written to a directory
+def directory_bytes(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory))
+
+
+# Original scripts: pandas drop_duplicates() and groupby(), row-wise input_power, full-resolution HTML
+def pandas_stages(file_name, columns_by_family, output_dir):
+    columns = aggregation.family_columns(columns_by_family)
+    temperature_columns = aggregation.family_columns(columns_by_family, aggregation.TEMPERATURE_FAMILIES)
+    state = {}
+
+    def read():
+        state['df'] = pq.read_table(file_name).to_pandas()
+
+    def dedup():
+        state['df'] = state['df'].drop_duplicates()
+
+    def groupby():
+        state['df'] = state['df'].groupby(['timestamp', 'hostname']).agg({name: 'mean' for name in columns}).reset_index()
+
+    def node_temp_mean():
+        df = state['df']
+        df['node_temp_mean'] = df[temperature_columns].mean(axis=1)
+        df['input_power'] = df.apply(lambda row: row.ps0_input_power + row.ps1_input_power, axis=1)
+        df['cabinet'] = df['hostname'].str[:3]
+
+    def cabinet_rollup():
+        df = state['df']
+        state['cabinets'] = df.groupby(['timestamp', 'cabinet']).agg({'input_power': 'sum', 'node_temp_mean': 'mean'})
+        state['power'] = df.groupby(['timestamp']).agg({'input_power': 'sum'})['input_power'].values
+
+    def fft_psd():
+        power_fluctuations = np.diff(state['power'])
+        spectrum_real = np.real(np.fft.fft(power_fluctuations))
+        state['spectrum'] = np.abs(spectrum_real) ** 2
+        state['psd'] = spectrum_real[1:len(spectrum_real) // 2] / (len(power_fluctuations) * (1 / 60))
+
+    def html_export():
+        df = state['df']
+        px.scatter(df, x='input_power', y='node_temp_mean', color='cabinet', hover_name='hostname',
+                   hover_data=['timestamp']).write_html(os.path.join(output_dir, 'NodeScatterPlot.html'))
+        fig = go.Figure(go.Scatter(x=np.arange(len(state['power'])), y=state['power'], mode='lines'))
+        fig.write_html(os.path.join(output_dir, 'SUMMIT_Power_Consumption.html'))
+
+    return [read, dedup, groupby, node_temp_mean, cabinet_rollup, fft_psd, html_export]
+
+
+# Shared modules: Arrow scanner, fused dedup and sorted-key averaging into float32 means with categorical
+# hostnames and cabinets, column-wise metrics, bincount rollup, rfft/Welch spectra and reduced HTML
+def arrow_stages(file_name, columns_by_family, output_dir):
+    columns = aggregation.family_columns(columns_by_family)
+    state = {}
+
+    def read():
+        state['table'] = pa.Table.from_batches(summit_io.iter_batches(file_name))
+
+    def dedup():
+        state['deduplicated'] = aggregation.dedup_keys(state['table'])
+
+    def groupby():
+        state['df'] = aggregation.grouped_means(*state['deduplicated'], columns, aggregation.SENSOR_DTYPE)
+
+    def node_temp_mean():
+        df = aggregation.add_node_metrics(state['df'], columns_by_family)
+        df['cabinet'] = aggregation.cabinet_categories(df['hostname'])
+
+    def cabinet_rollup():
+        state['rollup'] = rollup.build(pa.Table.from_pandas(state['df'], preserve_index=False), columns_by_family)
+        state['power'] = state['rollup'].system_power()
+
+    def fft_psd():
+        power_fluctuations = np.diff(state['power'])
+        state['spectrum'] = spectral.power_spectrum(power_fluctuations)
+        state['psd'] = spectral.welch(power_fluctuations)
+
+    def html_export():
+        df = rendering.sample_rows(state['df'], 'hostname', 'cabinet', frame='timestamp')
+        fig = px.scatter(df, x='input_power', y='node_temp_mean', color='cabinet', hover_name='hostname',
+                         hover_data=['timestamp'], render_mode='webgl')
+        rendering.write_html(fig, os.path.join(output_dir, 'NodeScatterPlot.html'))
+        x, y = rendering.lttb(np.arange(len(state['power'])), state['power'])
+        fig = go.Figure(go.Scattergl(x=x, y=y, mode='lines'))
+        rendering.write_html(fig, os.path.join(output_dir, 'SUMMIT_Power_Consumption.html'))
+
+    return [read, dedup, groupby, node_temp_mean, cabinet_rollup, fft_psd, html_export]
+
+
+ENGINES = {'pandas': pandas_stages, 'arrow': arrow_stages}
+
+
+# Runs every stage of an engine once on a file and returns one result row per stage
+def run_engine(engine, file_name, columns_by_family):
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = []
+        for stage, function in zip(STAGES, ENGINES[engine](file_name, columns_by_family, output_dir)):
+            with PeakMemory() as memory:
+                started = time.perf_counter()
+                function()
+                seconds = time.perf_counter() - started
+            results.append({'engine': engine, 'stage': stage, 'seconds': seconds, 'peak_mib': memory.peak / 2**20})
+        results[-1]['html_mib'] = directory_bytes(output_dir) / 2**20
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stage-by-stage pipeline benchmark on synthetic telemetry')
+    parser.add_argument('--nodes', type=int, default=250)
+    parser.add_argument('--minutes', type=int, default=60, help='minutes of the 1x file')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--duplicates', type=float, default=synthetic.DUPLICATE_FRACTION)
+    parser.add_argument('--repeat', type=int, default=1, help='runs per engine, the fastest is kept')
+    parser.add_argument('--csv', help='also write the results to this CSV file')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for scale in args.scales:
+            file_name = synthetic.write_file(os.path.join(data_dir, f'{scale}x.parquet'), args.nodes,
+                                             args.minutes * scale, start='2020-01-20',
+                                             duplicate_fraction=args.duplicates)
+            metadata = pq.read_metadata(file_name)
+            print(f'\n{scale}x: {args.nodes} nodes x {args.minutes * scale} minutes, {metadata.num_rows:,} rows '
+                  f'({os.path.getsize(file_name) / 2**20:,.1f} MiB Parquet)')
+            columns_by_family = aggregation.find_columns(pq.read_schema(file_name).names)
+
+            totals = {}
+            for engine in args.engines:
+                runs = [run_engine(engine, file_name, columns_by_family) for _ in range(args.repeat)]
+                results = min(runs, key=lambda run: sum(row['seconds'] for row in run))
+                for row in results:
+                    row.update(scale=scale, rows=metadata.num_rows)
+                    print(f'{engine:>8} {row["stage"]:>15}: {row["seconds"]:9.3f} s {row["peak_mib"]:9.1f} MiB peak'
+                          + (f' {row["html_mib"]:8.1f} MiB html' if 'html_mib' in row else ''))
+                totals[engine] = sum(row['seconds'] for row in results)
+                print(f'{engine:>8} {"total":>15}: {totals[engine]:9.3f} s')
+                rows.extend(results)
+            if len(totals) > 1:
+                baseline, *others = args.engines
+                for engine in others:
+                    print(f'{engine:>8} {"speedup":>15}: {totals[baseline] / totals[engine]:9.2f}x over {baseline}')
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as output:
+            writer = csv.DictWriter(output, ['scale', 'rows', 'engine', 'stage', 'seconds', 'peak_mib', 'html_mib'])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
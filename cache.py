@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+import summit_io
+
+# Cache of the cleaned per-(timestamp, hostname) tables.
+# Each source file's deduplicated and averaged table is written once as an uncompressed Arrow IPC file with
+# dictionary-encoded hostnames, and later runs memory-map it instead of starting again from the raw Parquet.
+# Entries are keyed by the source file's path, size and modification time plus the aggregation config, and the
+# least recently used entries are evicted once the cache directory grows past its size limit.
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.environ.get('SUMMIT_CACHE_DIR', '.summit_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('SUMMIT_CACHE_MAX_BYTES', 50 * 2**30))
+CACHE_SUFFIX = '.arrow'
+
+
+# Name of the cache entry for a source file and aggregation config.
+# Any change to the file's size or modification time, or to the config, gives a new name.
+def cache_key(file_name, config):
+    stat = os.stat(file_name)
+    description = json.dumps({
+        'version': CACHE_VERSION,
+        'path': os.path.abspath(file_name),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'config': config,
+    }, sort_keys=True)
+    return f'{summit_io.day_stem(file_name)}-{hashlib.sha256(description.encode()).hexdigest()[:20]}{CACHE_SUFFIX}'
+
+
+# Memory-maps a cache entry; the returned table references the mapped file instead of copying it
+def _read_entry(path):
+    table = ipc.open_file(pa.memory_map(path)).read_all()
+    os.utime(path)      # the modification time records the last use for eviction
+    return table
+
+
+# Writes a table to a cache entry, going through a temporary file so readers never see a partial entry
+def _write_entry(path, table):
+    hostname_index = table.schema.get_field_index('hostname')
+    if hostname_index >= 0 and not pa.types.is_dictionary(table.schema.field(hostname_index).type):
+        table = table.set_column(hostname_index, 'hostname', table['hostname'].dictionary_encode())
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(temporary, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temporary, path)
+
+
+# Removes the least recently used of `entries`, (last use in ns, bytes, path) tuples, with `remove` until they
+# hold at most `max_bytes`. Entries listed in `keep` are never evicted. Shared by the cache and the query index.
+def evict_least_recent(entries, max_bytes, remove, keep=()):
+    total = sum(size for _, size, _ in entries)
+    keep = {os.path.abspath(path) for path in keep}
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            remove(path)
+        except FileNotFoundError:    # already evicted by another worker
+            pass
+        total -= size
+
+
+# Deletes the least recently used entries until the cache directory holds at most `max_bytes`.
+# Entries listed in `keep` are never evicted.
+def evict(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, keep=()):
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(CACHE_SUFFIX):
+            stat = entry.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    evict_least_recent(entries, max_bytes, os.remove, keep)
+
+
+# Cached version of summit_io.read_node_minutes(); returns a memory-mapped Arrow table.
+# Pass cache_dir=None to bypass the cache and read the raw file.
+def read_node_minutes(file_name, columns, dedup_columns=None, cache_dir=DEFAULT_CACHE_DIR,
+                      max_bytes=DEFAULT_MAX_BYTES):
+    columns = list(columns)
+    if cache_dir is None:
+        df = summit_io.read_node_minutes(file_name, columns, dedup_columns=dedup_columns)
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    config = {'columns': columns, 'dedup_columns': dedup_columns}
+    path = os.path.join(cache_dir, cache_key(file_name, config))
+    try:
+        return _read_entry(path)
+    except FileNotFoundError:
+        pass
+
+    df = summit_io.read_node_minutes(file_name, columns, dedup_columns=dedup_columns)
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_entry(path, pa.Table.from_pandas(df, preserve_index=False))
+    evict(cache_dir, max_bytes, keep=[path])
+    return _read_entry(path)
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+import aggregation
+import spectral
+
+# Batched power-dynamics analytics.
+# The fluctuation, magnitude, gradient, spectrum and PSD computations of Challenge_3.2 applied to a whole
+# [entity x minute] matrix at once, where an entity is a cabinet, a node or the full system. Minutes an
+# entity did not report are NaN in the matrix and are filled the same way for every entity before the
+# analytics run; the `missing` mask of the result tells which values were filled.
+
+FILL_METHODS = ('linear', 'previous', 'zero', None)
+
+
+# [entity x minute] matrix of values with NaN where an entity has no value for a minute.
+# `entity_codes` and `minute_codes` give the cell of every value.
+def entity_matrix(entity_codes, minute_codes, values, num_entities, num_minutes):
+    matrix = np.full((num_entities, num_minutes), np.nan)
+    matrix[entity_codes, minute_codes] = values
+    return matrix
+
+
+# Index of the closest valid minute at or before (or after, with reverse=True) every minute, -1 if none
+def _nearest_valid(valid, reverse=False):
+    minutes = np.arange(valid.shape[1])
+    if reverse:
+        index = np.where(valid, minutes, valid.shape[1])
+        index = np.minimum.accumulate(index[:, ::-1], axis=1)[:, ::-1]
+        return np.where(index == valid.shape[1], -1, index)
+    return np.maximum.accumulate(np.where(valid, minutes, -1), axis=1)
+
+
+# Fills the NaN minutes of every row: 'linear' interpolates between the surrounding readings, 'previous'
+# repeats the last reading, 'zero' uses 0 and None leaves the gaps. Gaps before the first or after the
+# last reading take the nearest reading; rows without any reading stay NaN.
+def fill_missing(matrix, method='linear'):
+    if method not in FILL_METHODS:
+        raise ValueError(f'unknown fill method {method!r}, expected one of {FILL_METHODS}')
+    missing = np.isnan(matrix)
+    if method is None or not missing.any():
+        return matrix
+    if method == 'zero':
+        return np.where(missing & ~missing.all(axis=1, keepdims=True), 0.0, matrix)
+
+    rows = np.arange(matrix.shape[0])[:, np.newaxis]
+    previous = _nearest_valid(~missing)
+    following = _nearest_valid(~missing, reverse=True)
+    previous_values = np.where(previous >= 0, matrix[rows, np.maximum(previous, 0)], np.nan)
+    following_values = np.where(following >= 0, matrix[rows, np.maximum(following, 0)], np.nan)
+    if method == 'previous':
+        filled = np.where(np.isnan(previous_values), following_values, previous_values)
+    else:
+        span = following - previous
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(span > 0, (np.arange(matrix.shape[1]) - previous) / span, 0.0)
+        filled = previous_values + (following_values - previous_values) * fraction
+        filled = np.where(np.isnan(previous_values), following_values, filled)
+        filled = np.where(np.isnan(following_values), previous_values, filled)
+    return np.where(missing, filled, matrix)
+
+
+# Power dynamics of every row of an [entity x minute] power matrix in one vectorized pass.
+# Returns a dict of arrays with one row per entity:
+#   fluctuations, magnitude   minute-to-minute change and its absolute value      [entity, minute - 1]
+#   gradient                  np.gradient of the power                             [entity, minute]
+#   spectrum                  |rfft|^2 of the fluctuations, DC excluded            [entity, frequency]
+#   psd                       Welch PSD of the fluctuations                        [entity, frequency]
+#   missing                   minutes that were filled                             [entity, minute]
+# together with the spectrum_frequencies and psd_frequencies in cycles per day.
+def power_dynamics(matrix, fill='linear', segment_length=spectral.DEFAULT_SEGMENT_LENGTH):
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float64))
+    missing = np.isnan(matrix)
+    power = fill_missing(matrix, fill)
+    fluctuations = np.diff(power, axis=1)
+    spectrum_frequencies, spectrum = spectral.power_spectrum(np.nan_to_num(fluctuations))
+    psd_frequencies, psd = spectral.welch(np.nan_to_num(fluctuations), segment_length)
+    return {
+        'fluctuations': fluctuations,
+        'magnitude': np.abs(fluctuations),
+        'gradient': np.gradient(power, axis=1) if power.shape[1] > 1 else np.zeros_like(power),
+        'spectrum_frequencies': spectrum_frequencies,
+        'spectrum': spectrum,
+        'psd_frequencies': psd_frequencies,
+        'psd': psd,
+        'missing': missing,
+    }
+
+
+# Regular one-minute grid from the first to the last of the sorted int64 `timestamps` (in `unit`), and the
+# grid column of every timestamp. Minutes missing for every entity become columns of their own, so they are
+# filled and reported in `missing` instead of being skipped.
+def minute_grid(timestamps, unit):
+    if not len(timestamps):
+        return timestamps, np.arange(0)
+    minute = aggregation.minute_length(unit)
+    grid = np.arange(timestamps[0], timestamps[-1] + minute, minute, dtype=np.int64)
+    return grid, (timestamps - timestamps[0]) // minute
+
+
+# [cabinet x minute] power matrix of a rollup.Rollup on a regular minute grid, NaN for minutes in which no
+# node of a cabinet reported
+def cabinet_matrix(day_rollup):
+    grid, columns = minute_grid(day_rollup.timestamps, day_rollup.unit)
+    matrix = np.full((len(day_rollup.cabinets), len(grid)), np.nan)
+    matrix[:, columns] = np.where(day_rollup.nodes > 0, day_rollup.power, np.nan).T
+    return day_rollup.cabinets, matrix
+
+
+# [node x minute] input power matrix of a per-node-minute Arrow table (timestamp, hostname and the
+# ps*_input_power columns) on a regular minute grid. Returns the hostnames, the int64 minute timestamps of the
+# grid and the matrix.
+def node_matrix(table, columns_by_family):
+    timestamps, minute_codes = np.unique(aggregation.timestamp_values(table['timestamp']), return_inverse=True)
+    grid, columns = minute_grid(timestamps, table.schema.field('timestamp').type.unit)
+    host_codes, hostnames = aggregation.hostname_codes(aggregation.column_array(table, 'hostname'))
+    input_power = sum(aggregation.column_array(table, name).to_numpy(zero_copy_only=False)
+                      for name in columns_by_family['input_power'])
+    matrix = entity_matrix(host_codes, columns[minute_codes], input_power, len(hostnames), len(grid))
+    return hostnames, grid, matrix
+
+
+# Largest value of every row ignoring NaN, -inf for rows without values
+def _row_max(values):
+    return np.where(np.isnan(values), -np.inf, values).max(axis=1, initial=-np.inf)
+
+
+# Ranks entities by their largest minute-to-minute swing, with the steepest gradient and the frequency
+# (cycles per day) holding the most PSD for context. Entities without any reading are left out.
+def rank_swings(names, result, top=10):
+    summary = pd.DataFrame({
+        'entity': names,
+        'max_magnitude': _row_max(result['magnitude']),
+        'max_gradient': _row_max(np.abs(result['gradient'])),
+        'dominant_frequency': result['psd_frequencies'][np.argmax(result['psd'], axis=1)],
+        'filled_minutes': result['missing'].sum(axis=1),
+    })
+    summary = summary[~result['missing'].all(axis=1)]
+    return summary.sort_values('max_magnitude', ascending=False, ignore_index=True).head(top)
@@ -0,0 +1,93 @@
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import dynamics
+import query
+import rollup
+import spectral
+import summit_io
+
+# Multi-day driver: every day's read, dedup, groupby and analysis is independent, so days are processed
+# in parallel worker processes. Workers hand back NumPy arrays or Arrow tables, which travel between
+# processes as raw buffers instead of pickled DataFrames.
+
+# Turns a file name such as '20200120.parquet' into the label 'Jan 20, 2020' used in plot titles.
+# Names that are not a YYYYMMDD date are labelled with their stem.
+def day_label(file_name):
+    stem = summit_io.day_stem(file_name)
+    try:
+        return pd.to_datetime(stem, format='%Y%m%d').strftime('%b %d, %Y')
+    except ValueError:
+        return stem
+
+
+# Per-node-minute table used by Challenge_3.1: timestamp, cabinet, hostname, input_power and node_temp_mean,
+# read through the day's query index and optionally limited to some cabinets
+def node_day(file_name, cache_dir=None, index_dir=query.DEFAULT_INDEX_DIR, cabinets=None):
+    day = query.update_day(file_name, index_dir, cache_dir)
+    df = query.query(cabinets=cabinets, metrics=['input_power', 'node_temp_mean'], index_dir=index_dir, days=[day])
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+# Everything Challenge_3.1 needs from a day in one worker call: the node_day() table and the day's cabinet
+# rollup, built from the same index
+def node_rollup_day(file_name, cache_dir=None, store_dir=rollup.DEFAULT_STORE_DIR,
+                    index_dir=query.DEFAULT_INDEX_DIR, cabinets=None):
+    table = node_day(file_name, cache_dir, index_dir, cabinets)
+    return table, rollup.update_day(file_name, store_dir, cache_dir, index_dir)
+
+
+# System power series and its dynamics used by Challenge_3.2, returned as a dict of NumPy arrays, along with
+# the `top` cabinets ranked by their largest minute-to-minute power swings as an Arrow table under 'swings'
+def power_day(file_name, cache_dir=None, store_dir=rollup.DEFAULT_STORE_DIR,
+              index_dir=query.DEFAULT_INDEX_DIR, top=10):
+    day_rollup = rollup.update_day(file_name, store_dir, cache_dir, index_dir)
+
+    # Input power for the entire system, read from the day's cabinet rollup
+    input_power = day_rollup.system_power()
+
+    # Power fluctuations, dropping the first minute which has no predecessor
+    power_fluctuations = np.diff(input_power)
+
+    # Power Spectrum from a real-input FFT of the power fluctuations, and Power Spectral Density (PSD)
+    # from Welch's averaged, windowed segments. Frequencies are in cycles per day.
+    spectrum_frequencies, spectrum = spectral.power_spectrum(power_fluctuations)
+    psd_frequencies, psd = spectral.welch(power_fluctuations)
+
+    return {
+        'input_power': input_power,
+        'magnitude': np.abs(power_fluctuations),
+        'gradient': np.gradient(input_power),
+        'spectrum_frequencies': spectrum_frequencies,
+        'spectrum': spectrum,
+        'psd_frequencies': psd_frequencies,
+        'psd': psd,
+        'swings': pa.Table.from_pandas(cabinet_swings(day_rollup, top), preserve_index=False),
+    }
+
+
+# Cabinets of a rollup.Rollup ranked by their largest minute-to-minute power swings
+def cabinet_swings(day_rollup, top=10):
+    cabinets, power = dynamics.cabinet_matrix(day_rollup)
+    return dynamics.rank_swings(cabinets, dynamics.power_dynamics(power), top)
+
+
+# Runs `function` on every file with up to `workers` processes (None uses every core) and
+# returns the results in the order of `file_names`. Extra keyword arguments are passed on to `function`.
+# Files are stored under their stem, so two files with the same stem are refused.
+def process_days(function, file_names, workers=None, **kwargs):
+    function = functools.partial(function, **kwargs)
+    file_names = list(file_names)
+    summit_io.check_day_stems(name for name in file_names if isinstance(name, str))
+    workers = min(workers or os.cpu_count() or 1, len(file_names))
+    # The scripts have no __main__ guard, so workers are forked; platforms without fork run serially
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [function(file_name) for file_name in file_names]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        return list(executor.map(function, file_names))
@@ -0,0 +1,147 @@
+import argparse
+import os
+import socket
+import zlib
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import aggregation
+import cache
+import multiday
+import rollup
+import summit_io
+
+# Partitioned, out-of-core execution for sweeps over the multi-year archive.
+# Work is split by day and by a stable hash of the hostname, so one task covers one day's share of the nodes. A
+# task reads only its nodes' rows from the day's file, drops duplicates and averages them, and saves a partial
+# per-(timestamp, cabinet) rollup. Duplicates always share a hostname, so every partition is cleaned exactly. The
+# partials are sums and are merged in any order into the day's rollup in the rollup store. Program 2 and the cabinet
+# plots of Program 1 then read that rollup without touching the raw file again. The node plots of Program 1 read the
+# query index instead, which is not partitioned and is still built from the whole file on one host.
+# Hosts cooperate through a shared filesystem. Each task is claimed by creating its claim file atomically, so any
+# number of hosts can run the same command against the same work directory and each task runs once:
+#     python partitioned.py --work-dir /shared/summit_work --partitions 16 --workers 8 /archive/2020*.parquet
+
+DEFAULT_WORK_DIR = os.environ.get('SUMMIT_WORK_DIR', '.summit_work')
+DEFAULT_PARTITIONS = 8
+
+
+# Partition of every hostname from a CRC-32 of its name, which is the same on every host and Python run
+def hostname_partitions(hostnames, partitions):
+    return np.array([zlib.crc32(str(hostname).encode()) % partitions for hostname in hostnames], dtype=np.int64)
+
+
+# Distinct hostnames of a file, read once from the hostname column and shared with the other tasks of the day
+def file_hostnames(file_name, work_dir=DEFAULT_WORK_DIR):
+    path = os.path.join(work_dir, os.path.splitext(cache.cache_key(file_name, 'hostnames'))[0] + '-hostnames.npy')
+    try:
+        return np.load(path).astype(object)
+    except FileNotFoundError:
+        pass
+    hostnames = pa.chunked_array([batch.column('hostname') for batch in summit_io.iter_batches(file_name, ['hostname'])],
+                                 pq.read_schema(file_name).field('hostname').type)
+    hostnames = np.sort(pc.unique(hostnames).drop_null().to_numpy(zero_copy_only=False).astype(object))
+    temporary = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp.npy'
+    np.save(temporary, hostnames.astype(str))
+    os.replace(temporary, path)
+    return hostnames
+
+
+# Path of a task's partial rollup in the work directory
+def partial_path(file_name, partition, partitions, work_dir=DEFAULT_WORK_DIR):
+    return os.path.join(work_dir, f'{summit_io.day_stem(file_name)}-{partition:04d}-of-{partitions:04d}.npz')
+
+
+# Key of a partial rollup, which changes whenever the source file or the partitioning changes
+def _partial_key(file_name, partition, partitions):
+    return cache.cache_key(file_name, {'rollup': rollup.ROLLUP_VERSION, 'partition': [partition, partitions]})
+
+
+# Builds and saves the partial rollup of one (day, partition) task, unless it is done or claimed elsewhere.
+# Returns the path of the partial, or None when another worker holds the task.
+def run_task(task, work_dir=DEFAULT_WORK_DIR, reclaim=False):
+    file_name, partition, partitions = task
+    path = partial_path(file_name, partition, partitions, work_dir)
+    key = _partial_key(file_name, partition, partitions)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if str(data['source_key']) == key:
+                return path
+    try:
+        claim = os.open(f'{path}.claim', os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if not reclaim:
+            return None
+        claim = os.open(f'{path}.claim', os.O_WRONLY | os.O_TRUNC)
+    with os.fdopen(claim, 'w') as claim_file:
+        claim_file.write(f'{socket.gethostname()} {os.getpid()}\n')
+
+    hostnames = file_hostnames(file_name, work_dir)
+    hostnames = hostnames[hostname_partitions(hostnames, partitions) == partition]
+    columns_by_family = aggregation.find_columns(pq.read_schema(file_name).names)
+    if len(hostnames):
+        df = summit_io.read_node_minutes(file_name, aggregation.family_columns(columns_by_family), hostnames=hostnames)
+        partial = rollup.build(pa.Table.from_pandas(df, preserve_index=False), columns_by_family)
+        partial.save(path, key)
+    else:
+        # No node hashes to this partition: an empty partial keeps the day complete
+        timestamp_type = pq.read_schema(file_name).field('timestamp').type
+        empty = np.zeros((0, 0))
+        rollup.Rollup(np.zeros(0, dtype=np.int64), timestamp_type.unit, timestamp_type.tz, np.array([], dtype=object),
+                      empty, empty, empty.astype(np.int64), empty.astype(np.int64)).save(path, key)
+    os.remove(f'{path}.claim')
+    return path
+
+
+# Merges the partials of a day into its rollup in the store once every partition is done.
+# Returns the path of the day's rollup, or None while partitions are still missing.
+def merge_day(file_name, partitions, work_dir=DEFAULT_WORK_DIR, store_dir=rollup.DEFAULT_STORE_DIR):
+    partials = []
+    for partition in range(partitions):
+        path = partial_path(file_name, partition, partitions, work_dir)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if str(data['source_key']) != _partial_key(file_name, partition, partitions):
+                return None
+        partials.append(rollup.Rollup.load(path))
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, f'{summit_io.day_stem(file_name)}.npz')
+    # Saved under the key rollup.update_day() checks, so the scripts pick the merged rollup up as is
+    rollup.Rollup.merge(partials).save(path, cache.cache_key(file_name, {'rollup': rollup.ROLLUP_VERSION}))
+    return path
+
+
+# Runs every unfinished (day, partition) task with `workers` local processes, then merges the finished days.
+# Returns the file names whose rollups were merged; days still held by other hosts are merged by whichever
+# host finishes last, or by running the command again.
+def run(file_names, partitions=DEFAULT_PARTITIONS, workers=None, work_dir=DEFAULT_WORK_DIR,
+        store_dir=rollup.DEFAULT_STORE_DIR, reclaim=False):
+    summit_io.check_day_stems(file_names)
+    os.makedirs(work_dir, exist_ok=True)
+    tasks = [(file_name, partition, partitions) for file_name in file_names for partition in range(partitions)]
+    multiday.process_days(run_task, tasks, workers, work_dir=work_dir, reclaim=reclaim)
+    merged = multiday.process_days(merge_day, file_names, workers, partitions=partitions, work_dir=work_dir,
+                                   store_dir=store_dir)
+    return [file_name for file_name, path in zip(file_names, merged) if path is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partitioned rollup build over many days and hosts')
+    parser.add_argument('file_names', nargs='+', help='daily Parquet files, named YYYYMMDD.parquet')
+    parser.add_argument('--partitions', type=int, default=DEFAULT_PARTITIONS, help='hostname hash partitions per day')
+    parser.add_argument('--workers', type=int, help='local worker processes (default: every core)')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR, help='shared directory for claims and partials')
+    parser.add_argument('--store-dir', default=rollup.DEFAULT_STORE_DIR, help='rollup store read by the scripts')
+    parser.add_argument('--reclaim', action='store_true', help='rerun tasks left claimed by a crashed worker')
+    args = parser.parse_args()
+
+    merged = run(args.file_names, args.partitions, args.workers, args.work_dir, args.store_dir, args.reclaim)
+    print(f'{len(merged)} of {len(args.file_names)} days merged into {args.store_dir}')
+
+
+if __name__ == '__main__':
+    main()
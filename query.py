@@ -0,0 +1,322 @@
+import json
+import os
+import shutil
+import socket
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+import aggregation
+import cache
+import summit_io
+
+# Indexed time and host queries over the processed telemetry.
+# Each day's cleaned per-(timestamp, hostname) table, with input_power and node_temp_mean added, is stored once
+# as an uncompressed Arrow IPC file holding one record batch per block of minutes. Rows inside a batch are sorted
+# by hostname, then timestamp. The index next to it holds the first and last timestamp of every batch (its min/max
+# statistics), the sorted hostnames, and the row offsets of every hostname in every batch. A query picks the
+# batches overlapping its time window and slices out the row ranges of the requested hosts. It reads only the
+# requested metric columns from the memory-mapped file, so a one-hour, one-cabinet lookup touches kilobytes.
+# Rows are stored compactly: int32 time offsets from the day's first timestamp, int32 codes into the sorted
+# hostnames, and float32 metrics. Timestamps and hostnames are rebuilt only for the rows a query returns.
+# The index is the persistent copy of the cleaned data: it is built straight from the raw file by default, and
+# the least recently used days are evicted once the index directory grows past the cache size limit.
+# Every build is written to a directory of its own, and the day's entry is a symbolic link switched to a new build
+# in one rename. An opened DayIndex maps its files, so it keeps reading the same build even after a rebuild or
+# an eviction deletes it.
+#     df = query.query('2020-01-20 06:00', '2020-01-20 07:00', cabinets=['a01'], metrics=['input_power'])
+
+INDEX_VERSION = 2
+DEFAULT_INDEX_DIR = os.environ.get('SUMMIT_INDEX_DIR', '.summit_index')
+BLOCK_MINUTES = 60          # minutes per record batch
+DATA_FILE = 'data.arrow'
+BUILD_SUFFIX = '.build'     # directories holding one build of a day, linked from the day's entry
+OPEN_ATTEMPTS = 3           # tries to open a day whose build is being replaced
+
+
+# Converts a user supplied time bound into an int64 timestamp in the unit and timezone of the stored data
+def _timestamp_value(value, timestamp_type):
+    return pc.cast(summit_io.timestamp_scalar(value, timestamp_type), pa.int64()).as_py()
+
+
+# On-disk index of one day: the memory-mapped data file plus its batch bounds, hostnames and row offsets
+# `path` is resolved to the current build once, and every file is opened here. Raises FileNotFoundError when
+# the build disappears while opening.
+class DayIndex:
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        with open(os.path.join(self.path, 'meta.json')) as meta:
+            self.meta = json.load(meta)
+        os.utime(os.path.join(self.path, 'meta.json'))     # the modification time records the last use for eviction
+        self.timestamp_type = pa.timestamp(self.meta['unit'], self.meta['tz'] or None)
+        self.bounds = np.load(os.path.join(self.path, 'bounds.npy'))                    # [batch, (first, last)]
+        self.hostnames = np.load(os.path.join(self.path, 'hostnames.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(self.path, 'offsets.npy'), mmap_mode='r')  # [batch, hostname + 1]
+        self.data = pa.memory_map(os.path.join(self.path, DATA_FILE))
+
+    # Positions in `hostnames` of the requested hosts and of every host in the requested cabinets
+    def host_positions(self, hosts=None, cabinets=None):
+        if hosts is None and cabinets is None:
+            return np.arange(len(self.hostnames))
+        positions = []
+        if hosts is not None:
+            hosts = np.unique(np.asarray(list(hosts), dtype=str))
+            found = np.searchsorted(self.hostnames, hosts)
+            inside = found < len(self.hostnames)
+            found, hosts = found[inside], hosts[inside]
+            positions.append(found[self.hostnames[found] == hosts])
+        for cabinet in cabinets or ():
+            # Hostnames are sorted, so the hosts starting with the cabinet form one contiguous range; only those whose
+            # first three characters are the cabinet belong to it, as in summit_io.build_filter()
+            first = np.searchsorted(self.hostnames, cabinet)
+            last = np.searchsorted(self.hostnames, cabinet + '\uffff')
+            in_cabinet = np.asarray(self.hostnames[first:last]).astype('<U3') == cabinet
+            positions.append(np.arange(first, last)[in_cabinet])
+        return np.unique(np.concatenate(positions)) if positions else np.arange(0)
+
+    # Rows of the requested hosts and columns from the batches overlapping [start, end), as an Arrow table with
+    # the timestamp, a dictionary-encoded hostname over this day's hostnames, and the value columns
+    def read(self, start=None, end=None, hosts=None, cabinets=None, columns=None):
+        batches = np.arange(len(self.bounds))
+        if start is not None:
+            batches = batches[self.bounds[batches, 1] >= start]
+        if end is not None:
+            batches = batches[self.bounds[batches, 0] < end]
+        positions = self.host_positions(hosts, cabinets)
+        columns = ['offset', 'host'] + [name for name in (columns or self.meta['columns'])
+                                        if name not in ('timestamp', 'hostname', 'offset', 'host')]
+
+        reader = ipc.open_file(self.data)
+        pieces = []
+        for batch_index in batches:
+            batch = reader.get_batch(int(batch_index)).select(columns)
+            offsets = self.offsets[batch_index]
+            for first, last in _ranges(offsets[positions], offsets[positions + 1]):
+                pieces.append(batch.slice(first, last - first))
+        table = pa.Table.from_batches(pieces) if pieces else reader.schema.empty_table().select(columns)
+
+        time_offsets = aggregation.column_array(table, 'offset').to_numpy()
+        timestamps = self.meta['origin'] + time_offsets.astype(np.int64) * self.meta['step']
+        if start is not None or end is not None:
+            keep = np.ones(len(timestamps), dtype=bool)
+            if start is not None:
+                keep &= timestamps >= start
+            if end is not None:
+                keep &= timestamps < end
+            if not keep.all():
+                table, timestamps = table.filter(pa.array(keep)), timestamps[keep]
+        hostnames = pa.DictionaryArray.from_arrays(aggregation.column_array(table, 'host'),
+                                                   pa.array(self.hostnames, pa.string()))
+        return pa.table([pa.array(timestamps, pa.int64()).cast(self.timestamp_type), hostnames]
+                        + table.columns[2:], names=['timestamp', 'hostname'] + columns[2:])
+
+
+# Merges adjacent [first, last) row ranges of consecutive hosts into as few slices as possible
+def _ranges(firsts, lasts):
+    ranges = []
+    for first, last in zip(firsts.tolist(), lasts.tolist()):
+        if first == last:
+            continue
+        if ranges and ranges[-1][1] == first:
+            ranges[-1][1] = last
+        else:
+            ranges.append([first, last])
+    return ranges
+
+
+# Writes the index of a per-node-minute Arrow table (timestamp, hostname and sensor columns) to `path`
+def build(table, columns_by_family, path, source_key, block_minutes=BLOCK_MINUTES):
+    timestamp_type = table.schema.field('timestamp').type
+    timestamps = aggregation.timestamp_values(aggregation.column_array(table, 'timestamp'))
+    host_codes, hostnames = aggregation.hostname_codes(aggregation.column_array(table, 'hostname'))
+    value_columns = [name for name in table.schema.names if name not in ('timestamp', 'hostname')]
+    input_power, node_temp_mean = aggregation.table_node_metrics(table, columns_by_family)
+
+    # Timestamps become int32 offsets from the first one, counted in the largest step that divides them all
+    # (one minute for the SUMMIT files)
+    origin = int(timestamps.min()) if len(timestamps) else 0
+    time_offsets = timestamps - origin
+    step = int(np.gcd.reduce(time_offsets)) if len(time_offsets) else 1
+    step = step or aggregation.minute_length(timestamp_type.unit)
+    time_offsets //= step
+    if len(time_offsets) and time_offsets.max() > np.iinfo(np.int32).max:
+        raise ValueError(f'{path}: timestamps span too many steps of {step} {timestamp_type.unit} for int32 offsets')
+
+    # Blocks are aligned on whole multiples of the block length, then rows are sorted by hostname inside each
+    blocks = timestamps // (block_minutes * aggregation.minute_length(timestamp_type.unit))
+    order = np.lexsort((timestamps, host_codes, blocks))
+    blocks, host_codes, timestamps = blocks[order], host_codes[order], timestamps[order]
+    starts = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1]]) if len(blocks) else np.arange(0)
+    stops = np.r_[starts[1:], len(blocks)]
+
+    schema = pa.schema([('offset', pa.int32()), ('host', pa.int32())]
+                       + [(name, pa.float32()) for name in value_columns + ['input_power', 'node_temp_mean']])
+    temporary = f'{path}.{socket.gethostname()}.{os.getpid()}.{time.time_ns()}{BUILD_SUFFIX}'
+    os.makedirs(temporary)
+    offsets = np.empty((len(starts), len(hostnames) + 1), dtype=np.int64)
+    bounds = np.empty((len(starts), 2), dtype=np.int64)
+    with pa.OSFile(os.path.join(temporary, DATA_FILE), 'wb') as sink, ipc.new_file(sink, schema) as writer:
+        # Only one block of rows is ever gathered in sorted order
+        for i, (start, stop) in enumerate(zip(starts, stops)):
+            rows = order[start:stop]
+            block = table.select(value_columns).take(pa.array(rows))
+            arrays = [pa.array(time_offsets[rows].astype(np.int32)), pa.array(host_codes[start:stop].astype(np.int32))]
+            arrays += [aggregation.column_array(block, name).cast(pa.float32()) for name in value_columns]
+            arrays += [pa.array(input_power[rows], pa.float32()), pa.array(node_temp_mean[rows], pa.float32())]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            offsets[i] = np.searchsorted(host_codes[start:stop], np.arange(len(hostnames) + 1))
+            bounds[i] = timestamps[start:stop].min(), timestamps[start:stop].max()
+    np.save(os.path.join(temporary, 'bounds.npy'), bounds)
+    np.save(os.path.join(temporary, 'hostnames.npy'), hostnames.astype(str))
+    np.save(os.path.join(temporary, 'offsets.npy'), offsets)
+    with open(os.path.join(temporary, 'meta.json'), 'w') as meta:
+        json.dump({'version': INDEX_VERSION, 'source_key': source_key, 'unit': timestamp_type.unit,
+                   'tz': timestamp_type.tz or '', 'origin': origin, 'step': step,
+                   'columns': ['timestamp', 'hostname'] + value_columns + ['input_power', 'node_temp_mean']}, meta)
+
+    # Opened before it is published, so a concurrent rebuild or eviction cannot delete it first
+    day = DayIndex(temporary)
+    _publish(path, temporary)
+    return day
+
+
+# Points the day's entry at a finished build in one rename, then deletes the build it replaced. Readers that
+# already opened the old build keep their mapped files; new readers only ever see a complete build.
+def _publish(path, build_dir):
+    link = f'{build_dir}.link'
+    os.symlink(os.path.basename(build_dir), link)
+    previous = os.path.realpath(path) if os.path.lexists(path) else None
+    if previous is not None and not os.path.islink(path):
+        # A day written before builds were linked: move it aside, as a directory cannot be renamed over
+        previous = f'{build_dir}.previous'
+        os.replace(path, previous)
+    os.replace(link, path)
+    if previous is not None and previous != build_dir:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+# Deletes a day's entry, then its build
+def _remove_day(path):
+    build_dir = os.path.realpath(path)
+    if os.path.islink(path):
+        os.remove(path)
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+
+# Names of the days in the index directory: links to builds, or directories written before builds were linked
+def _day_names(index_dir):
+    if not os.path.isdir(index_dir):
+        return []
+    return sorted(entry.name for entry in os.scandir(index_dir)
+                  if (entry.is_symlink() or entry.is_dir())
+                  and not entry.name.endswith((BUILD_SUFFIX, f'{BUILD_SUFFIX}.link', f'{BUILD_SUFFIX}.previous', '.tmp')))
+
+
+# Opens a day, retrying while a rebuild switches it to a new build
+def _open_day(path):
+    for attempt in range(OPEN_ATTEMPTS):
+        try:
+            return DayIndex(path)
+        except FileNotFoundError:
+            if attempt == OPEN_ATTEMPTS - 1:
+                raise
+
+
+# Bytes of the files of a day's index
+def _day_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+# Deletes the least recently used day indexes until the index directory holds at most `max_bytes`.
+# Days listed in `keep` are never evicted.
+def evict(index_dir=DEFAULT_INDEX_DIR, max_bytes=cache.DEFAULT_MAX_BYTES, keep=()):
+    days = []
+    for name in _day_names(index_dir):
+        path = os.path.join(index_dir, name)
+        try:
+            days.append((os.stat(os.path.join(path, 'meta.json')).st_mtime_ns, _day_bytes(os.path.realpath(path)),
+                         path))
+        except FileNotFoundError:    # evicted by another worker, or not a day index
+            pass
+    cache.evict_least_recent(days, max_bytes, _remove_day, keep)
+
+
+# Returns the day's opened index, building it only when it is missing or its source file changed.
+# The index is built from the raw file; pass a cache_dir to also keep the cleaned table in the cache.
+def update_day(file_name, index_dir=DEFAULT_INDEX_DIR, cache_dir=None, max_bytes=cache.DEFAULT_MAX_BYTES):
+    path = os.path.join(index_dir, summit_io.day_stem(file_name))
+    source_key = cache.cache_key(file_name, {'index': INDEX_VERSION})
+    try:
+        day = _open_day(path)
+        if day.meta['source_key'] == source_key and day.meta['version'] == INDEX_VERSION:
+            return day
+    except FileNotFoundError:
+        pass
+
+    columns_by_family = aggregation.find_columns(pq.read_schema(file_name).names)
+    table = cache.read_node_minutes(file_name, aggregation.family_columns(columns_by_family), cache_dir=cache_dir)
+    os.makedirs(index_dir, exist_ok=True)
+    day = build(table, columns_by_family, path, source_key)
+    evict(index_dir, max_bytes, keep=[path])
+    return day
+
+
+# Per-node-minute rows of the indexed days within [start, end), limited to the given hosts and cabinets.
+# `metrics` selects the value columns (any sensor column, input_power or node_temp_mean; every column by
+# default) and `days` limits the search to the given day stems such as '20200120', or to DayIndex objects such
+# as those returned by update_day(). Returns a DataFrame with timestamp, categorical cabinet and hostname
+# columns and the float32 metrics, sorted by timestamp then hostname.
+# When searching every day, days indexed by an older version or evicted meanwhile are skipped. Requested by
+# name, they raise ValueError or FileNotFoundError; update_day() rebuilds them.
+def query(start=None, end=None, hosts=None, cabinets=None, metrics=None, index_dir=DEFAULT_INDEX_DIR, days=None):
+    every_day = days is None
+    if every_day:
+        days = _day_names(index_dir)
+    tables = []
+    timestamp_type, value_columns = pa.timestamp('ns'), list(metrics or [])
+    for day in days:
+        if isinstance(day, DayIndex):
+            index = day
+        else:
+            try:
+                index = _open_day(os.path.join(index_dir, day))
+            except FileNotFoundError:
+                if every_day:
+                    continue
+                raise FileNotFoundError(f'day {day} is not indexed in {index_dir}; build it with query.update_day() '
+                                        'on its source file') from None
+        if index.meta.get('version') != INDEX_VERSION:
+            if every_day:
+                continue
+            raise ValueError(f"index of day {day} in {index_dir} has version {index.meta.get('version')}, expected "
+                             f'{INDEX_VERSION}; rebuild it with query.update_day() on its source file')
+        timestamp_type = index.timestamp_type
+        if metrics is None:
+            value_columns = [name for name in index.meta['columns'] if name not in ('timestamp', 'hostname')]
+        first = None if start is None else _timestamp_value(start, index.timestamp_type)
+        last = None if end is None else _timestamp_value(end, index.timestamp_type)
+        if not len(index.bounds) or (first is not None and index.bounds[-1, 1] < first) or \
+                (last is not None and index.bounds[0, 0] >= last):
+            continue
+        tables.append(index.read(first, last, hosts, cabinets, metrics))
+
+    if not tables:
+        # No rows, or no index yet: an empty table with the same column types as a non-empty result
+        tables.append(pa.schema([('timestamp', timestamp_type), ('hostname', pa.dictionary(pa.int32(), pa.string()))]
+                                + [(name, pa.float32()) for name in value_columns]).empty_table())
+
+    # Each day carries its own hostname dictionary; unified, the codes index one sorted list of hostnames
+    table = pa.concat_tables(tables).unify_dictionaries()
+    host_codes, hostnames = aggregation.hostname_codes(aggregation.column_array(table, 'hostname'))
+    timestamps = aggregation.timestamp_values(aggregation.column_array(table, 'timestamp'))
+    order = np.lexsort((host_codes, timestamps))
+    df = table.drop_columns('hostname').take(pa.array(order)).to_pandas()
+    df.insert(1, 'hostname', pd.Categorical.from_codes(host_codes[order], categories=hostnames)
+              .remove_unused_categories())
+    df.insert(1, 'cabinet', aggregation.cabinet_categories(df['hostname']))
+    return df
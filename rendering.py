@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# Plot-size reduction for the HTML exports.
+# The number of points written to a chart is bounded by what a screen can show rather than by the size of
+# the fleet: line charts are downsampled with Largest-Triangle-Three-Buckets (LTTB), scatters keep a sample
+# of nodes drawn evenly from every cabinet, and animations keep a bounded number of frames. Traces are drawn
+# with WebGL and every HTML file loads one shared plotly.js bundle instead of embedding its own copy.
+
+MAX_LINE_POINTS = 1000      # points per line trace, about one per horizontal pixel of a subplot
+MAX_POINTS = 20000          # points in a static scatter
+MAX_FRAME_POINTS = 1000     # points in each animation frame
+MAX_FRAMES = 288            # animation frames, one every 5 minutes for a day
+PLOTLYJS = 'directory'      # plotly.js is written once as plotly.min.js next to the HTML files ('cdn' also works)
+
+
+# Downsamples a line to at most `threshold` points with Largest-Triangle-Three-Buckets, which keeps the
+# peaks and troughs a plain stride would skip. Returns the selected x and y values (all of them when
+# `threshold` is None).
+def lttb(x, y, threshold=MAX_LINE_POINTS):
+    x, y = np.asarray(x), np.asarray(y)
+    if threshold is None or threshold >= len(x) or threshold < 3:
+        return x, y
+    edges = np.unique(np.linspace(1, len(x) - 1, threshold - 1).astype(np.int64))
+    selected = [0]
+    for bucket in range(len(edges) - 1):
+        start, stop = edges[bucket], edges[bucket + 1]
+        following = slice(stop, edges[bucket + 2] if bucket + 2 < len(edges) else len(x))
+        next_x, next_y = x[following].mean(), y[following].mean()
+        # Pick the point forming the largest triangle with the previous pick and the next bucket's average
+        previous = selected[-1]
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous]) -
+                       (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        selected.append(start + int(np.argmax(areas)))
+    selected.append(len(x) - 1)
+    return x[selected], y[selected]
+
+
+# Picks up to `max_entities` distinct entities (such as hostnames), spread over the groups (such as
+# cabinets) in proportion to their size with at least one per group. When there are more groups than
+# `max_entities`, a random subset of the groups gets one entity each. The same seed always picks the same set.
+def sample_entities(entities, groups, max_entities, seed=0):
+    pairs = pd.DataFrame({'entity': entities, 'group': groups}).drop_duplicates('entity')
+    if len(pairs) <= max_entities:
+        return pairs['entity'].to_numpy()
+    share = max_entities / len(pairs)
+    shuffled = pairs.sample(frac=1, random_state=seed)
+    rank = shuffled.groupby('group', observed=True).cumcount()
+    quota = np.maximum(1, np.round(shuffled.groupby('group', observed=True)['entity'].transform('size') * share))
+    # Rounding and the one-per-group minimum can overshoot; the first picks of every group are kept first
+    picked = rank[rank < quota].sort_values(kind='stable')
+    return shuffled.loc[picked.index[:max_entities], 'entity'].to_numpy()
+
+
+# Keeps a sample of nodes spread over every cabinet so that the frame holds at most `max_points` rows.
+# When even the sampled nodes hold too many rows, evenly spaced values of `frame` (such as timestamps) are
+# kept as well, or evenly spaced rows without a `frame`.
+def sample_rows(df, entity, group, max_points=MAX_POINTS, seed=0, frame=None):
+    if len(df) <= max_points:
+        return df
+    rows_per_entity = len(df) / df[entity].nunique()
+    keep = sample_entities(df[entity], df[group], max(1, int(max_points / rows_per_entity)), seed)
+    df = df[df[entity].isin(keep)]
+    if len(df) > max_points and frame is not None:
+        frames = np.sort(df[frame].unique())
+        count = max(1, int(len(frames) * max_points / len(df)))
+        df = df[df[frame].isin(frames[np.linspace(0, len(frames) - 1, count).astype(np.int64)])]
+    if len(df) > max_points:
+        df = df.iloc[np.linspace(0, len(df) - 1, max_points).astype(np.int64)]
+    return df
+
+
+# Reduces an animation to at most `max_frames` evenly spaced frames of at most `max_frame_points` points.
+# The same nodes are kept in every frame so that they move smoothly from frame to frame.
+def sample_animation(df, frame, entity, group, max_frame_points=MAX_FRAME_POINTS, max_frames=MAX_FRAMES, seed=0):
+    frames = np.sort(df[frame].unique())
+    if len(frames) > max_frames:
+        df = df[df[frame].isin(frames[np.linspace(0, len(frames) - 1, max_frames).astype(np.int64)])]
+    keep = sample_entities(df[entity], df[group], max_frame_points, seed)
+    return df[df[entity].isin(keep)]
+
+
+# Writes a figure to HTML, loading plotly.js from the shared bundle instead of inlining it
+def write_html(fig, file_name, plotlyjs=PLOTLYJS):
+    fig.write_html(file_name, include_plotlyjs=plotlyjs)
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import aggregation
+import cache
+import query
+import summit_io
+
+# Pre-aggregated node -> cabinet -> system rollups.
+# For every day the per-node-minute table is reduced once into dense arrays indexed by [minute, cabinet]
+# (cabinet = hostname[:3]) and saved next to the other days. Both scripts and new queries read the rollups
+# directly, and a new day's file only builds its own rollup without touching earlier days.
+
+ROLLUP_VERSION = 1
+DEFAULT_STORE_DIR = os.environ.get('SUMMIT_ROLLUP_DIR', '.summit_rollups')
+
+
+# Dense per-minute, per-cabinet aggregates:
+#   timestamps  int64 minute timestamps in `unit`, one per row of the arrays
+#   cabinets    cabinet names, one per column of the arrays
+#   power       summed node input_power          [minute, cabinet]
+#   temp_sum    summed node_temp_mean            [minute, cabinet]
+#   temp_count  nodes with a node_temp_mean      [minute, cabinet]
+#   nodes       nodes reporting                  [minute, cabinet]
+class Rollup:
+    def __init__(self, timestamps, unit, tz, cabinets, power, temp_sum, temp_count, nodes):
+        self.timestamps = timestamps
+        self.unit = unit
+        self.tz = tz
+        self.cabinets = cabinets
+        self.power = power
+        self.temp_sum = temp_sum
+        self.temp_count = temp_count
+        self.nodes = nodes
+
+    # Total input power of the system for each minute
+    def system_power(self):
+        return self.power.sum(axis=1)
+
+    # Average node temperature of each cabinet, NaN where no node reported a temperature
+    def cabinet_temperature(self):
+        return aggregation.means_from_sums(self.temp_sum, self.temp_count)
+
+    # Minute timestamps as pandas Timestamps in the source file's timezone
+    def datetimes(self):
+        return pa.array(self.timestamps, pa.int64()).cast(pa.timestamp(self.unit, self.tz or None)).to_pandas()
+
+    # Long per-(timestamp, cabinet) frame like groupby(['timestamp', 'cabinet']).agg(
+    # {'input_power': 'sum', 'node_temp_mean': 'mean'}), holding only cells where nodes reported
+    def cabinet_frame(self):
+        minutes, cabinets = np.nonzero(self.nodes)
+        return pd.DataFrame({
+            'timestamp': self.datetimes().take(minutes).reset_index(drop=True),
+            'cabinet': self.cabinets[cabinets],
+            'input_power': self.power[minutes, cabinets],
+            'node_temp_mean': self.cabinet_temperature()[minutes, cabinets],
+        })
+
+    # Places the arrays on a wider list of cabinets, filling cabinets absent from this rollup with zeros
+    def aligned(self, cabinets):
+        columns = np.searchsorted(cabinets, self.cabinets)
+        arrays = []
+        for array in (self.power, self.temp_sum, self.temp_count, self.nodes):
+            wide = np.zeros((len(self.timestamps), len(cabinets)), dtype=array.dtype)
+            wide[:, columns] = array
+            arrays.append(wide)
+        return Rollup(self.timestamps, self.unit, self.tz, cabinets, *arrays)
+
+    # Stacks several days along the minute axis on the union of their cabinets
+    @classmethod
+    def concatenate(cls, rollups):
+        cabinets = np.unique(np.concatenate([rollup.cabinets for rollup in rollups]))
+        aligned = [rollup.aligned(cabinets) for rollup in rollups]
+        return cls(np.concatenate([rollup.timestamps for rollup in aligned]), rollups[0].unit, rollups[0].tz, cabinets,
+                   *[np.concatenate([getattr(rollup, name) for rollup in aligned])
+                     for name in ('power', 'temp_sum', 'temp_count', 'nodes')])
+
+    # Adds up partial rollups, such as those of disjoint sets of nodes, on the union of their minutes and cabinets.
+    # Every array is a sum, so partials can be merged in any order and grouping.
+    @classmethod
+    def merge(cls, rollups):
+        timestamps = np.unique(np.concatenate([rollup.timestamps for rollup in rollups]))
+        cabinets = np.unique(np.concatenate([rollup.cabinets for rollup in rollups]))
+        names = ('power', 'temp_sum', 'temp_count', 'nodes')
+        arrays = {name: np.zeros((len(timestamps), len(cabinets)), dtype=getattr(rollups[0], name).dtype)
+                  for name in names}
+        for rollup in rollups:
+            cells = np.ix_(np.searchsorted(timestamps, rollup.timestamps), np.searchsorted(cabinets, rollup.cabinets))
+            for name in names:
+                arrays[name][cells] += getattr(rollup, name)
+        return cls(timestamps, rollups[0].unit, rollups[0].tz, cabinets.astype(object), *arrays.values())
+
+    def save(self, path, source_key):
+        temporary = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(temporary, version=ROLLUP_VERSION, source_key=source_key, timestamps=self.timestamps,
+                 unit=self.unit, tz=self.tz or '', cabinets=self.cabinets.astype(str), power=self.power,
+                 temp_sum=self.temp_sum, temp_count=self.temp_count, nodes=self.nodes)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['timestamps'], str(data['unit']), str(data['tz']), data['cabinets'].astype(object),
+                       data['power'], data['temp_sum'], data['temp_count'], data['nodes'])
+
+
+# Reduces a per-node-minute Arrow table (timestamp, hostname and either the sensor columns or input_power and
+# node_temp_mean) into a Rollup
+def build(table, columns_by_family):
+    timestamp_type = table.schema.field('timestamp').type
+    timestamp_uniques, minute_codes = np.unique(aggregation.timestamp_values(table['timestamp']), return_inverse=True)
+
+    # Cabinets come from the distinct hostnames, not from a string slice of every row
+    host_codes, hostnames = aggregation.hostname_codes(aggregation.column_array(table, 'hostname'))
+    cabinets, cabinet_of_host = np.unique(pd.Index(hostnames).str[:3].to_numpy(dtype=object), return_inverse=True)
+    cells = minute_codes * len(cabinets) + cabinet_of_host[host_codes]
+    shape = (len(timestamp_uniques), len(cabinets))
+
+    # The two metrics are read straight from their Arrow columns, or computed one sensor column at a time
+    if 'input_power' in table.schema.names and 'node_temp_mean' in table.schema.names:
+        input_power, node_temp_mean = (
+            np.asarray(aggregation.column_array(table, name).to_numpy(zero_copy_only=False), dtype=np.float64)
+            for name in ('input_power', 'node_temp_mean'))
+    else:
+        input_power, node_temp_mean = aggregation.table_node_metrics(table, columns_by_family)
+    has_temp = ~np.isnan(node_temp_mean)
+
+    # Sums skip missing values like groupby().sum()
+    def cell_sums(weights):
+        return np.bincount(cells, weights=weights, minlength=shape[0] * shape[1]).reshape(shape)
+
+    return Rollup(
+        timestamp_uniques, timestamp_type.unit, timestamp_type.tz, cabinets.astype(object),
+        cell_sums(np.nan_to_num(input_power, nan=0.0)),
+        cell_sums(np.where(has_temp, node_temp_mean, 0.0)),
+        cell_sums(has_temp.astype(np.float64)).astype(np.int64),
+        np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape),
+    )
+
+
+# Returns the day's Rollup, building and saving it only when it is missing or its source file changed.
+# New rollups are built from the day's input_power and node_temp_mean read through the query index.
+def update_day(file_name, store_dir=DEFAULT_STORE_DIR, cache_dir=None,
+               index_dir=query.DEFAULT_INDEX_DIR):
+    path = os.path.join(store_dir, summit_io.day_stem(file_name) + '.npz')
+    source_key = cache.cache_key(file_name, {'rollup': ROLLUP_VERSION})
+    if os.path.exists(path):
+        with np.load(path) as data:
+            current = str(data['source_key']) == source_key and int(data['version']) == ROLLUP_VERSION
+        if current:
+            return Rollup.load(path)
+
+    day = query.update_day(file_name, index_dir, cache_dir)
+    df = query.query(metrics=['input_power', 'node_temp_mean'], index_dir=index_dir, days=[day])
+    rollup = build(pa.Table.from_pandas(df.drop(columns='cabinet'), preserve_index=False), None)
+    os.makedirs(store_dir, exist_ok=True)
+    rollup.save(path, source_key)
+    return rollup
+
+
+# Loads the saved rollups of the given day stems (every saved day by default) as one Rollup
+def load(store_dir=DEFAULT_STORE_DIR, days=None):
+    if days is None:
+        days = sorted(os.path.splitext(name)[0] for name in os.listdir(store_dir) if name.endswith('.npz'))
+    return Rollup.concatenate([Rollup.load(os.path.join(store_dir, f'{day}.npz')) for day in days])
@@ -0,0 +1,82 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Spectral engine for the power series.
+# Spectra use real-input FFTs, and the Power Spectral Density is estimated with Welch's method: the series is
+# cut into overlapping Hann-windowed segments whose periodograms are averaged. Segments are accumulated one
+# chunk at a time, so a PSD over months or years of 1-minute data is computed in bounded memory, and every
+# function accepts a 2-D [series, minute] array to transform many days, cabinets or nodes in one FFT call.
+
+MINUTES_PER_DAY = 1440
+DEFAULT_SEGMENT_LENGTH = 256    # minutes per Welch segment, about 5.6 cycles per day of resolution
+DEFAULT_OVERLAP = 0.5
+
+
+# Frequencies in cycles per day of the rfft bins of an n-sample series sampled every minute
+def frequencies(n, sampling_rate=MINUTES_PER_DAY):
+    return np.fft.rfftfreq(n, d=1 / sampling_rate)
+
+
+# One-sided power spectrum |rfft(x)|^2 along the last axis, without the DC bin.
+# Returns the frequencies in cycles per day and the spectrum.
+def power_spectrum(x, sampling_rate=MINUTES_PER_DAY):
+    x = np.asarray(x, dtype=np.float64)
+    spectrum = np.abs(np.fft.rfft(x, axis=-1)) ** 2
+    return frequencies(x.shape[-1], sampling_rate)[1:], spectrum[..., 1:]
+
+
+# Streaming Welch estimator. Feed consecutive chunks of a series (or of a [series, minute] batch) with
+# update(); only the samples of the unfinished segment are kept between chunks.
+class WelchAccumulator:
+    def __init__(self, segment_length=DEFAULT_SEGMENT_LENGTH, overlap=DEFAULT_OVERLAP,
+                 sampling_rate=MINUTES_PER_DAY):
+        self.segment_length = segment_length
+        self.step = max(1, int(round(segment_length * (1 - overlap))))
+        self.sampling_rate = sampling_rate
+        self.window = np.hanning(segment_length + 1)[:-1]      # periodic Hann window
+        self.pending = None
+        self.periodogram_sum = None
+        self.segments = 0
+
+    def update(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        self.pending = chunk if self.pending is None else np.concatenate([self.pending, chunk], axis=-1)
+        available = self.pending.shape[-1]
+        if available < self.segment_length:
+            return self
+        count = (available - self.segment_length) // self.step + 1
+
+        # All complete segments of the chunk as a strided view, transformed with one rfft call
+        segments = sliding_window_view(self.pending, self.segment_length, axis=-1)[..., ::self.step, :][..., :count, :]
+        segments = segments - segments.mean(axis=-1, keepdims=True)      # remove each segment's mean
+        periodograms = np.abs(np.fft.rfft(segments * self.window, axis=-1)) ** 2
+        periodogram_sum = periodograms.sum(axis=-2)
+        self.periodogram_sum = periodogram_sum if self.periodogram_sum is None else self.periodogram_sum + periodogram_sum
+        self.segments += count
+        self.pending = self.pending[..., count * self.step:].copy()
+        return self
+
+    # Frequencies in cycles per day and the one-sided PSD in units² per cycle per day, DC bin excluded
+    def result(self):
+        if not self.segments:
+            raise ValueError(f'at least {self.segment_length} samples are needed for a Welch segment')
+        psd = self.periodogram_sum / (self.segments * self.sampling_rate * np.sum(self.window ** 2))
+        psd[..., 1:(self.segment_length + 1) // 2] *= 2      # fold the negative frequencies in, except Nyquist
+        return frequencies(self.segment_length, self.sampling_rate)[1:], psd[..., 1:]
+
+
+# Welch PSD of a whole series or [series, minute] batch. Series shorter than a segment use a single
+# segment covering the whole series.
+def welch(x, segment_length=DEFAULT_SEGMENT_LENGTH, overlap=DEFAULT_OVERLAP, sampling_rate=MINUTES_PER_DAY):
+    x = np.asarray(x, dtype=np.float64)
+    segment_length = min(segment_length, x.shape[-1])
+    return WelchAccumulator(segment_length, overlap, sampling_rate).update(x).result()
+
+
+# Welch PSD of a series delivered as an iterable of chunks, such as one day or one file at a time
+def welch_stream(chunks, segment_length=DEFAULT_SEGMENT_LENGTH, overlap=DEFAULT_OVERLAP,
+                 sampling_rate=MINUTES_PER_DAY):
+    accumulator = WelchAccumulator(segment_length, overlap, sampling_rate)
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator.result()
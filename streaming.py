@@ -0,0 +1,276 @@
+import argparse
+import os
+import socket
+import time
+from collections import deque
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+import aggregation
+import spectral
+import summit_io
+
+# Real-time ingestion of per-minute telemetry batches with power swing alerts.
+# Batches arrive from a watched directory or a local socket. Rows are routed to one summit_io.NodeMinuteAccumulator
+# per open minute, which drops duplicates and averages (timestamp, hostname) values incrementally. A minute is
+# closed once rows more than `lateness` minutes newer have arrived; there is no wall-clock timeout, so the newest
+# minutes stay open until more data comes or the stream ends. A closed minute is reduced to the system input power,
+# and its state is discarded, so a new batch never reprocesses the rest of the day.
+# Closed minutes feed constant-work rolling signals: the power magnitude and gradient of Challenge_3.2 and a
+# sliding-window spectrum of the power fluctuations. Crossing a threshold emits an alert.
+#     python streaming.py --watch incoming/ --magnitude 500000 --gradient 300000
+#     python streaming.py --socket /tmp/summit.sock --magnitude 500000
+
+POLL_INTERVAL = 1.0         # seconds between scans of a watched directory
+WATCH_SUFFIXES = ('.parquet', '.arrow')
+
+
+# Sliding DFT of the last `window_length` samples. Each new sample updates every bin with one complex
+# multiply-add instead of a new FFT, and the bins are recomputed exactly once per window to stop rounding drift.
+class SlidingSpectrum:
+    def __init__(self, window_length=spectral.DEFAULT_SEGMENT_LENGTH, sampling_rate=spectral.MINUTES_PER_DAY):
+        self.window_length = window_length
+        self.sampling_rate = sampling_rate
+        self.twiddles = np.exp(2j * np.pi * np.arange(window_length // 2 + 1) / window_length)
+        self.bins = np.zeros(window_length // 2 + 1, dtype=np.complex128)
+        self.samples = np.zeros(window_length)
+        self.count = 0
+
+    def update(self, x):
+        position = self.count % self.window_length
+        self.bins = (self.bins - self.samples[position] + x) * self.twiddles
+        self.samples[position] = x
+        self.count += 1
+        if self.count % self.window_length == 0:
+            self.bins = np.fft.rfft(self.samples)     # the ring buffer is in time order again
+        return self
+
+    def ready(self):
+        return self.count >= self.window_length
+
+    # Frequencies in cycles per day and |rfft|^2 of the window without the DC bin, as spectral.power_spectrum()
+    def result(self):
+        return spectral.frequencies(self.window_length, self.sampling_rate)[1:], np.abs(self.bins[1:]) ** 2
+
+
+# Magnitude, gradient and sliding spectrum of the system power, updated once per closed minute.
+# The gradient is np.gradient's central difference, so the gradient of a minute is known one minute later.
+class RollingDynamics:
+    def __init__(self, window_length=spectral.DEFAULT_SEGMENT_LENGTH):
+        self.recent = deque(maxlen=3)       # (timestamp, input_power) of the last three minutes
+        self.spectrum = SlidingSpectrum(window_length)
+
+    def update(self, timestamp, input_power):
+        self.recent.append((timestamp, input_power))
+        signals = {'timestamp': timestamp, 'input_power': input_power}
+        if len(self.recent) < 2:
+            return signals
+        fluctuation = input_power - self.recent[-2][1]
+        signals['magnitude'] = abs(fluctuation)
+        # Central difference of the previous minute; the first minute uses a one-sided difference
+        signals['gradient_timestamp'] = self.recent[-2][0]
+        signals['gradient'] = (input_power - self.recent[0][1]) / 2 if len(self.recent) == 3 else fluctuation
+        self.spectrum.update(fluctuation)
+        if self.spectrum.ready():
+            frequencies, spectrum = self.spectrum.result()
+            peak = int(np.argmax(spectrum))
+            signals['dominant_frequency'] = frequencies[peak]
+            signals['dominant_spectrum'] = spectrum[peak]
+        return signals
+
+
+# Streaming counterpart of the Challenge_3.2 system power processing. add() takes record batches in arrival
+# order and returns the signals of every minute it closes, each with the alerts raised for that minute.
+# Rows that arrive for an already closed minute are counted in `late_rows` and ignored.
+class PowerStream:
+    def __init__(self, magnitude_threshold=None, gradient_threshold=None, spectrum_threshold=None,
+                 window_length=spectral.DEFAULT_SEGMENT_LENGTH, lateness=0, dedup_columns=None):
+        self.thresholds = {'magnitude': magnitude_threshold, 'gradient': gradient_threshold,
+                           'dominant_spectrum': spectrum_threshold}
+        self.lateness = lateness
+        self.dedup_columns = dedup_columns
+        self.dynamics = RollingDynamics(window_length)
+        self.open_minutes = {}              # int64 timestamp -> NodeMinuteAccumulator
+        self.input_power_columns = None
+        self.timestamp_type = None
+        self.minute = None                  # one minute in the timestamp unit
+        self.last_closed = None
+        self.late_rows = 0
+
+    def add(self, batch):
+        if self.input_power_columns is None:
+            self.input_power_columns = aggregation.find_columns(batch.schema.names)['input_power']
+            self.timestamp_type = batch.schema.field('timestamp').type
+            self.minute = aggregation.minute_length(self.timestamp_type.unit)
+        valid = pc.is_valid(batch.column('timestamp'))
+        if not pc.all(valid).as_py():
+            batch = batch.filter(valid)
+        if not batch.num_rows:
+            return []
+
+        timestamps = aggregation.timestamp_values(batch.column('timestamp'))
+        minutes = np.unique(timestamps)
+        for timestamp in minutes:
+            rows = batch if len(minutes) == 1 else batch.filter(pa.array(timestamps == timestamp))
+            if self.last_closed is not None and timestamp <= self.last_closed:
+                self.late_rows += rows.num_rows
+                continue
+            if timestamp not in self.open_minutes:
+                self.open_minutes[timestamp] = summit_io.NodeMinuteAccumulator(self.input_power_columns)
+            self.open_minutes[timestamp].add(rows, self.dedup_columns)
+
+        watermark = max(self.open_minutes, default=self.last_closed) - self.lateness * self.minute
+        return self._close(lambda timestamp: timestamp < watermark)
+
+    # Closes every open minute, such as at the end of a stream
+    def flush(self):
+        return self._close(lambda timestamp: True)
+
+    def _close(self, closable):
+        closed = []
+        for timestamp in sorted(self.open_minutes):
+            if not closable(timestamp):
+                break
+            df = self.open_minutes.pop(timestamp).result()
+            # A missing supply reading leaves the node's input_power missing, and sum() skips it
+            input_power = df[self.input_power_columns].to_numpy(dtype=np.float64).sum(axis=1)
+            signals = self.dynamics.update(self._datetime(timestamp), float(np.nansum(input_power)))
+            signals['nodes'] = len(df)
+            signals['alerts'] = self._alerts(signals)
+            closed.append(signals)
+            self.last_closed = timestamp
+        return closed
+
+    def _datetime(self, timestamp):
+        return pa.scalar(int(timestamp), pa.int64()).cast(self.timestamp_type).as_py()
+
+    def _alerts(self, signals):
+        alerts = []
+        for signal, threshold in self.thresholds.items():
+            if threshold is None or signal not in signals or abs(signals[signal]) < threshold:
+                continue
+            timestamp = signals['gradient_timestamp'] if signal == 'gradient' else signals['timestamp']
+            alerts.append({'timestamp': timestamp, 'signal': signal, 'value': signals[signal], 'threshold': threshold})
+        return alerts
+
+
+# Record batches of an Arrow IPC file or a Parquet file
+def read_file(file_name):
+    if file_name.endswith('.arrow'):
+        with pa.memory_map(file_name) as source:
+            reader = ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+    else:
+        yield from summit_io.iter_batches(file_name)
+
+
+# Yields the record batches of every new file in `directory`, oldest name first, polling for new files until
+# interrupted (or only once with once=True). Producers should write to a temporary name and rename the file
+# into place, so a file is never read half written.
+def watch_directory(directory, poll_interval=POLL_INTERVAL, once=False):
+    seen = set()
+    while True:
+        new_files = sorted(name for name in os.listdir(directory)
+                           if name.endswith(WATCH_SUFFIXES) and name not in seen)
+        for name in new_files:
+            seen.add(name)
+            yield from read_file(os.path.join(directory, name))
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+# A listening local socket: a path gives a Unix domain socket, 'host:port' a TCP socket
+def _server_socket(address):
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        server = socket.create_server((host, int(port)))
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(address)
+        server.listen()
+    return server
+
+
+def _client_socket(address):
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return socket.create_connection((host, int(port)))
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(address)
+    return client
+
+
+# Yields the record batches sent to a local socket. Every connection carries one Arrow IPC stream, and
+# connections are served one after another until interrupted.
+def listen_socket(address):
+    with _server_socket(address) as server:
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile('rb') as source:
+                try:
+                    yield from ipc.open_stream(source)
+                except pa.ArrowInvalid:     # the producer disconnected without sending a stream
+                    continue
+
+
+# Sends record batches to a socket served by listen_socket() as one Arrow IPC stream
+def send_batches(address, batches):
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return
+    with _client_socket(address) as client, client.makefile('wb') as sink:
+        with ipc.new_stream(sink, first.schema) as writer:
+            writer.write_batch(first)
+            for batch in batches:
+                writer.write_batch(batch)
+
+
+# Feeds every batch of `source` through `stream` and prints each closed minute and its alerts
+def run(source, stream):
+    try:
+        for batch in source:
+            report(stream.add(batch))
+    except KeyboardInterrupt:
+        pass
+    report(stream.flush())
+
+
+def report(closed):
+    for signals in closed:
+        magnitude = signals.get('magnitude')
+        print(f"{signals['timestamp']}  input power {signals['input_power']:14,.1f} W  nodes {signals['nodes']:5d}"
+              + (f'  magnitude {magnitude:12,.1f} W' if magnitude is not None else ''))
+        for alert in signals['alerts']:
+            print(f"ALERT {alert['timestamp']}  {alert['signal']} {alert['value']:,.1f} "
+                  f"crossed {alert['threshold']:,.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streams per-minute telemetry and alerts on power swings')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--watch', help='directory receiving Parquet or Arrow IPC files of telemetry rows')
+    source.add_argument('--socket', help="Unix socket path or 'host:port' receiving Arrow IPC streams")
+    parser.add_argument('--magnitude', type=float, help='alert when the minute-to-minute change reaches this (W)')
+    parser.add_argument('--gradient', type=float, help='alert when the power gradient reaches this (W/min)')
+    parser.add_argument('--spectrum', type=float, help='alert when the peak of the sliding spectrum reaches this')
+    parser.add_argument('--window', type=int, default=spectral.DEFAULT_SEGMENT_LENGTH, help='spectrum window in minutes')
+    parser.add_argument('--lateness', type=int, default=0, help='minutes to wait for late rows before closing a minute')
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL, help='seconds between directory scans')
+    args = parser.parse_args()
+
+    stream = PowerStream(args.magnitude, args.gradient, args.spectrum, args.window, args.lateness)
+    run(watch_directory(args.watch, args.poll) if args.watch else listen_socket(args.socket), stream)
+    if stream.late_rows:
+        print(f'{stream.late_rows:,} rows arrived after their minute was closed and were ignored')
+
+
+if __name__ == '__main__':
+    main()
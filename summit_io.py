@@ -0,0 +1,187 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import aggregation
+
+# Shared loading layer for the SUMMIT telemetry Parquet files.
+# Only the requested columns are read, optional timestamp/hostname/cabinet predicates are pushed
+# down to pyarrow, and row groups are streamed in batches through the dedup and
+# (timestamp, hostname) averaging stages, so peak memory follows the batch size instead of the file size.
+
+KEY_COLUMNS = ['timestamp', 'hostname']
+DEFAULT_BATCH_SIZE = 256 * 1024
+
+
+# Name of a day's file without its directory and extension, such as '20200120' for 'data/20200120.parquet'.
+# The index, rollup and partial stores are keyed by it.
+def day_stem(file_name):
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+# Raises ValueError when two files share a stem, since their index and rollup entries would overwrite each other
+def check_day_stems(file_names):
+    seen = {}
+    for file_name in file_names:
+        stem = day_stem(file_name)
+        if stem in seen and os.path.abspath(seen[stem]) != os.path.abspath(file_name):
+            raise ValueError(f'{seen[stem]} and {file_name} share the day name {stem!r}; '
+                             'rename one of them so their indexes and rollups do not overwrite each other')
+        seen[stem] = file_name
+
+
+# Converts a user supplied time bound into a scalar matching the file's timestamp type
+def timestamp_scalar(value, arrow_type):
+    value = pd.Timestamp(value)
+    if pa.types.is_timestamp(arrow_type):
+        if arrow_type.tz is not None and value.tzinfo is None:
+            value = value.tz_localize(arrow_type.tz)
+        elif arrow_type.tz is None and value.tzinfo is not None:
+            value = value.tz_convert(None)
+    return pa.scalar(value, type=arrow_type)
+
+
+# Builds a pyarrow filter expression from the optional time window, hostnames and cabinets (hostname[:3])
+def build_filter(schema, start=None, end=None, hostnames=None, cabinets=None):
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field('timestamp') >= timestamp_scalar(start, schema.field('timestamp').type))
+    if end is not None:
+        conditions.append(ds.field('timestamp') < timestamp_scalar(end, schema.field('timestamp').type))
+    if hostnames is not None:
+        conditions.append(ds.field('hostname').isin(list(hostnames)))
+    if cabinets is not None:
+        conditions.append(pc.utf8_slice_codeunits(ds.field('hostname'), 0, 3).isin(list(cabinets)))
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+# Streams record batches of a Parquet file with column projection and predicate pushdown
+def iter_batches(file_name, columns=None, start=None, end=None, hostnames=None, cabinets=None,
+                 batch_size=DEFAULT_BATCH_SIZE):
+    dataset = ds.dataset(file_name, format='parquet')
+    expression = build_filter(dataset.schema, start, end, hostnames, cabinets)
+    # Low readahead keeps only a couple of row groups in flight at any time
+    scanner = dataset.scanner(columns=columns, filter=expression, batch_size=batch_size,
+                              batch_readahead=1, fragment_readahead=1)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch
+
+
+# Accumulates per-(timestamp, hostname) sums and counts across record batches while dropping exact duplicate
+# rows with the fused kernel in aggregation. Rows are keyed by int64 timestamps and hostname codes that stay
+# stable across batches; duplicates split over batches are recognised by their 64-bit row fingerprint, so
+# only 8 bytes per distinct row are carried between batches instead of the rows themselves.
+class NodeMinuteAccumulator:
+    def __init__(self, value_columns):
+        self.value_columns = list(value_columns)
+        self.hostnames = pd.Index([], dtype=object)
+        self.timestamp_type = None
+        self.seen_fingerprints = np.empty(0, dtype=np.uint64)
+        self.partials = []
+
+    # Maps the batch's hostnames to codes shared by every batch, registering new hostnames as they appear
+    def _hostname_codes(self, array):
+        if not pa.types.is_dictionary(array.type):
+            array = array.dictionary_encode()
+        dictionary = pd.Index(array.dictionary.to_numpy(zero_copy_only=False).astype(object))
+        new_hostnames = dictionary.difference(self.hostnames, sort=False)
+        if len(new_hostnames):
+            self.hostnames = self.hostnames.append(new_hostnames)
+        return self.hostnames.get_indexer(dictionary)[array.indices.to_numpy(zero_copy_only=False)]
+
+    def add(self, batch, dedup_columns=None):
+        # groupby() drops rows without a timestamp or hostname
+        valid = pc.and_(pc.is_valid(batch.column('timestamp')), pc.is_valid(batch.column('hostname')))
+        if not pc.all(valid).as_py():
+            batch = batch.filter(valid)
+        if not batch.num_rows:
+            return
+        self.timestamp_type = batch.schema.field('timestamp').type
+
+        timestamp_uniques, timestamp_codes = np.unique(aggregation.timestamp_values(batch.column('timestamp')),
+                                                       return_inverse=True)
+        host_codes = self._hostname_codes(batch.column('hostname'))
+        keys = timestamp_codes.astype(np.int64) * len(self.hostnames) + host_codes
+
+        # Drop duplicates inside the batch, then rows already seen in an earlier batch
+        dedup_columns = batch.schema.names if dedup_columns is None else dedup_columns
+        arrays = [batch.column(name) for name in dedup_columns]
+        rows, fingerprints = aggregation.drop_duplicate_rows(keys, arrays)
+        positions = np.searchsorted(self.seen_fingerprints, fingerprints)
+        already_seen = positions < len(self.seen_fingerprints)
+        already_seen[already_seen] = self.seen_fingerprints[positions[already_seen]] == fingerprints[already_seen]
+        new_fingerprints = np.unique(fingerprints[~already_seen])
+        insert_at = np.searchsorted(self.seen_fingerprints, new_fingerprints)
+        self.seen_fingerprints = np.insert(self.seen_fingerprints, insert_at, new_fingerprints)
+        rows = rows[~already_seen]
+
+        # Sum and non-null count per key, combined into means once all batches are in
+        unique_keys, sums, counts = aggregation.sorted_group_sums(
+            keys[rows], aggregation.float_columns(batch, self.value_columns, rows), len(self.value_columns))
+        timestamp_codes, host_codes = np.divmod(unique_keys, len(self.hostnames))
+        # A key rarely holds more than a few rows per batch, so the counts are kept in the narrowest integer type
+        counts = counts.astype(np.min_scalar_type(counts.max())) if counts.size else counts
+        self.partials.append((timestamp_uniques[timestamp_codes], host_codes, sums, counts))
+
+    # Per-(timestamp, hostname) means of `dtype` with a categorical hostname. The partials are ordered once,
+    # then reduced one value column at a time straight into the output array, so no concatenated
+    # [row x column] sums or counts are ever held.
+    def result(self, dtype=aggregation.SENSOR_DTYPE):
+        if not self.partials:
+            return pd.DataFrame(columns=KEY_COLUMNS + self.value_columns)
+        timestamps = np.concatenate([partial[0] for partial in self.partials])
+        host_codes = np.concatenate([partial[1] for partial in self.partials])
+
+        # Rank hostnames lexically so the result is sorted by timestamp then hostname, like groupby()
+        hostname_order = np.argsort(self.hostnames.to_numpy(), kind='stable')
+        hostname_rank = np.empty(len(hostname_order), dtype=np.int64)
+        hostname_rank[hostname_order] = np.arange(len(hostname_order))
+        timestamp_uniques, timestamp_codes = np.unique(timestamps, return_inverse=True)
+        keys = timestamp_codes.astype(np.int64) * len(self.hostnames) + hostname_rank[host_codes]
+        del timestamps, host_codes, timestamp_codes
+
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        means = np.empty((len(starts), len(self.value_columns)), dtype=dtype, order='F')
+        for i in range(len(self.value_columns)):
+            sums = aggregation.segment_sums(np.concatenate([partial[2][:, i] for partial in self.partials])[order],
+                                            starts)
+            counts = aggregation.segment_sums(
+                np.concatenate([partial[3][:, i] for partial in self.partials], dtype=np.int32)[order], starts)
+            means[:, i] = aggregation.means_from_sums(sums, counts)
+        timestamp_codes, host_ranks = np.divmod(keys[starts], len(self.hostnames))
+        return aggregation.keyed_frame(timestamp_uniques[timestamp_codes], self.timestamp_type, host_ranks,
+                                       self.hostnames.to_numpy()[hostname_order], self.value_columns, means)
+
+
+# Reads one day of telemetry and returns the deduplicated per-(timestamp, hostname) means of `columns`.
+# Equivalent to pq.read_table(file_name).to_pandas().drop_duplicates().groupby(['timestamp', 'hostname']).mean()
+# restricted to `columns`, up to floating point summation order. Duplicates inside a batch are confirmed column
+# by column; duplicates split over batches are matched on their 64-bit fingerprint only, so two different rows
+# would be merged only if their fingerprints collided (about one chance in 2**64 per pair). By default duplicates are detected over every column of the file, as
+# drop_duplicates() did; pass dedup_columns to compare fewer columns and read less data.
+# The means are float32 (aggregation.SENSOR_DTYPE) and the hostname is categorical; pass dtype=np.float64 for
+# full-width means.
+def read_node_minutes(file_name, columns, start=None, end=None, hostnames=None, cabinets=None,
+                      dedup_columns=None, batch_size=DEFAULT_BATCH_SIZE, dtype=aggregation.SENSOR_DTYPE):
+    columns = list(columns)
+    if dedup_columns is None:
+        read_columns = None
+    else:
+        dedup_columns = list(dict.fromkeys(KEY_COLUMNS + list(dedup_columns)))
+        read_columns = list(dict.fromkeys(dedup_columns + columns))
+    accumulator = NodeMinuteAccumulator(columns)
+    for batch in iter_batches(file_name, read_columns, start, end, hostnames, cabinets, batch_size):
+        accumulator.add(batch, dedup_columns)
+    return accumulator.result(dtype)
@@ -0,0 +1,136 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Synthetic SUMMIT node telemetry.
+# Generates Parquet files with the schema of the SUMMIT 1-minute telemetry (timestamp, hostname and the power and
+# temperature sensors of every node) so both scripts and the benchmarks can run without the real multi-GB files.
+# Readings follow a daily load cycle per cabinet, and each minute carries the artifacts of the 1hz to 1min
+# conversion: exact copies of rows plus rows that repeat a (timestamp, hostname) with different readings.
+# Data is generated one block of minutes at a time, so files of any size are written in bounded memory.
+#     python synthetic.py 20200120.parquet                      # full day: 4626 nodes x 1440 minutes
+#     python synthetic.py 20200120.parquet --nodes 500 --minutes 240
+
+NODES = 4626
+MINUTES = 1440
+NODES_PER_CABINET = 18
+DUPLICATE_FRACTION = 0.2        # extra rows as a fraction of the node-minutes, half exact copies
+MISSING_FRACTION = 0.001        # sensor readings left empty
+BLOCK_MINUTES = 60              # minutes generated at once, and written as one Parquet row group
+
+GPU_POWER_COLUMNS = [f'p{p}_gpu{g}_power' for p in range(2) for g in range(3)]
+CPU_POWER_COLUMNS = ['p0_power', 'p1_power']
+GPU_TEMP_COLUMNS = [f'gpu{g}_{kind}_temp' for g in range(6) for kind in ('core', 'mem')]
+CPU_TEMP_COLUMNS = [f'p{p}_core{c}_temp' for p in range(2) for c in range(24) if c != 13]
+INPUT_POWER_COLUMNS = ['ps0_input_power', 'ps1_input_power']
+SENSOR_COLUMNS = GPU_POWER_COLUMNS + CPU_POWER_COLUMNS + GPU_TEMP_COLUMNS + CPU_TEMP_COLUMNS + INPUT_POWER_COLUMNS
+
+SCHEMA = pa.schema([('timestamp', pa.timestamp('ns', tz='UTC')), ('hostname', pa.string())] +
+                   [(name, pa.float64()) for name in SENSOR_COLUMNS])
+
+
+# SUMMIT-style hostnames such as 'a01n01', 18 nodes per cabinet; the first three characters name the cabinet
+def hostnames(nodes=NODES):
+    return np.array([f'{chr(97 + cabinet // 36)}{cabinet % 36 + 1:02d}n{node + 1:02d}'
+                     for cabinet in range(-(-nodes // NODES_PER_CABINET)) for node in range(NODES_PER_CABINET)][:nodes],
+                    dtype=object)
+
+
+# Sensor readings for node-minute pairs. `load` is the utilisation (0 to 1) of every row, and the input power
+# follows the components' power plus a fixed overhead, split over the two supplies.
+def _readings(rng, load):
+    def noisy(base, scale, spread):
+        return base + scale * load[:, np.newaxis] + rng.normal(0.0, spread, (len(load), 1))
+
+    gpu_power = noisy(50.0, 250.0, 10.0) + rng.normal(0.0, 5.0, (len(load), len(GPU_POWER_COLUMNS)))
+    cpu_power = noisy(40.0, 150.0, 5.0) + rng.normal(0.0, 3.0, (len(load), len(CPU_POWER_COLUMNS)))
+    gpu_temp = noisy(30.0, 40.0, 2.0) + rng.normal(0.0, 1.0, (len(load), len(GPU_TEMP_COLUMNS)))
+    gpu_temp[:, 1::2] += 5.0        # memory runs hotter than the core
+    cpu_temp = noisy(35.0, 30.0, 2.0) + rng.normal(0.0, 1.0, (len(load), len(CPU_TEMP_COLUMNS)))
+    total = (gpu_power.sum(axis=1) + cpu_power.sum(axis=1)) * 1.1 + 250.0
+    share = rng.uniform(0.47, 0.53, len(load))
+    input_power = np.column_stack([total * share, total * (1 - share)])
+    return np.concatenate([gpu_power, cpu_power, gpu_temp, cpu_temp, input_power], axis=1).round(1)
+
+
+# Yields the telemetry as Arrow record batches of `block_minutes` minutes each, rows shuffled within a block
+def iter_batches(nodes=NODES, minutes=MINUTES, start='2020-01-20', duplicate_fraction=DUPLICATE_FRACTION,
+                 missing_fraction=MISSING_FRACTION, seed=0, block_minutes=BLOCK_MINUTES):
+    names = hostnames(nodes)
+    cabinet_codes = np.arange(nodes) // NODES_PER_CABINET
+    setup = np.random.default_rng(seed)
+    cabinet_phase = setup.uniform(0.0, 1.0, cabinet_codes.max() + 1)[cabinet_codes]
+    node_offset = setup.normal(0.0, 0.1, nodes)
+    start = pd.Timestamp(start, tz='UTC').value
+
+    for block, first in enumerate(range(0, minutes, block_minutes)):
+        rng = np.random.default_rng([seed, block])
+        block_length = min(block_minutes, minutes - first)
+        minute_codes = np.repeat(np.arange(first, first + block_length), nodes)
+        host_codes = np.tile(np.arange(nodes), block_length)
+        rows = len(minute_codes)
+
+        # Daily cycle per cabinet plus per-node and per-minute variation
+        cycle = np.sin(2 * np.pi * (minute_codes / MINUTES + cabinet_phase[host_codes]))
+        load = np.clip(0.55 + 0.3 * cycle + node_offset[host_codes] + rng.normal(0.0, 0.05, rows), 0.0, 1.0)
+        values = _readings(rng, load)
+
+        # Conversion artifacts: the first half of the extra rows copy a row exactly, the rest repeat its key
+        extra = rng.choice(rows, int(rows * duplicate_fraction))
+        copies = len(extra) // 2
+        values = np.concatenate([values, _readings(rng, load[extra[copies:]])])
+        if missing_fraction:
+            values[rng.random(values.shape) < missing_fraction] = np.nan
+        values = np.concatenate([values[:rows], values[extra[:copies]], values[rows:]])
+        minute_codes = np.concatenate([minute_codes, minute_codes[extra]])
+        host_codes = np.concatenate([host_codes, host_codes[extra]])
+
+        order = rng.permutation(len(minute_codes))
+        arrays = [
+            pa.array(start + minute_codes[order] * 60_000_000_000, pa.int64()).cast(SCHEMA.field('timestamp').type),
+            pa.array(names[host_codes[order]], pa.string()),
+        ]
+        arrays += [pa.array(column, pa.float64(), from_pandas=True) for column in values[order].T]
+        yield pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+# The whole telemetry as one in-memory Arrow table, with the names of its sensor columns
+def synthetic_day(nodes=NODES, minutes=MINUTES, duplicate_fraction=DUPLICATE_FRACTION, seed=0, **kwargs):
+    batches = iter_batches(nodes, minutes, duplicate_fraction=duplicate_fraction, seed=seed, **kwargs)
+    return pa.Table.from_batches(list(batches), schema=SCHEMA), list(SENSOR_COLUMNS)
+
+
+# Writes the telemetry to a Parquet file, one row group per block of minutes. The first minute defaults to the
+# date of a YYYYMMDD file name such as '20200120.parquet'.
+def write_file(file_name, nodes=NODES, minutes=MINUTES, start=None, **kwargs):
+    if start is None:
+        stem = os.path.splitext(os.path.basename(file_name))[0]
+        start = pd.to_datetime(stem, format='%Y%m%d') if stem.isdigit() and len(stem) == 8 else '2020-01-20'
+    with pq.ParquetWriter(file_name, SCHEMA) as writer:
+        for batch in iter_batches(nodes, minutes, start, **kwargs):
+            writer.write_batch(batch)
+    return file_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Writes synthetic SUMMIT telemetry Parquet files')
+    parser.add_argument('file_names', nargs='+', help='output files, named YYYYMMDD.parquet to set the date')
+    parser.add_argument('--nodes', type=int, default=NODES)
+    parser.add_argument('--minutes', type=int, default=MINUTES)
+    parser.add_argument('--duplicates', type=float, default=DUPLICATE_FRACTION, help='extra rows as a fraction of the node-minutes')
+    parser.add_argument('--missing', type=float, default=MISSING_FRACTION, help='fraction of empty sensor readings')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for i, file_name in enumerate(args.file_names):
+        write_file(file_name, args.nodes, args.minutes, duplicate_fraction=args.duplicates,
+                   missing_fraction=args.missing, seed=args.seed + i)
+        print(f'{file_name}: {os.path.getsize(file_name) / 2**20:,.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()